@@ -1,10 +1,11 @@
 import os
-from flask import Flask, render_template, send_from_directory
+from flask import Flask, make_response, render_template
 from flask_cors import CORS
 from config import settings
-import logging
-from logging.handlers import RotatingFileHandler
-from openai import OpenAI
+import hashlib
+import http_caching
+import metrics
+import logging_config
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -14,18 +15,8 @@ load_dotenv()
 
 
 def setup_logging(app):
-    """Set up logging configuration"""
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-
-    file_handler = RotatingFileHandler(
-        'logs/app.log', maxBytes=10240, backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-    file_handler.setLevel(logging.INFO)
-
-    app.logger.addHandler(file_handler)
-    app.logger.setLevel(logging.INFO)
+    """Set up logging configuration (see logging_config.py)"""
+    logging_config.init_app(app)
     app.logger.info('Application startup')
 
 
@@ -52,21 +43,28 @@ def create_app():
     # Setup logging
     setup_logging(app)
 
-    # Configure OpenAI with new client
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
     # Register blueprints
     from routes.api import api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
 
+    # Compression, conditional requests and fingerprinted static files
+    http_caching.init_app(app)
+
+    # Request timing and the /metrics endpoint
+    metrics.init_app(app)
+
     # Basic routes
     @app.route('/')
     def index():
-        return render_template('index.html')
-
-    @app.route('/static/<path:path>')
-    def serve_static(path):
-        return send_from_directory('static', path)
+        html = render_template('index.html')
+        etag = hashlib.sha256(html.encode('utf-8')).hexdigest()[:32]
+        cached = http_caching.not_modified(etag)
+        if cached is not None:
+            return cached
+        response = make_response(html)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = http_caching.REVALIDATE_CACHE_CONTROL
+        return response
 
     return app
 
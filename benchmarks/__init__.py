@@ -0,0 +1 @@
+"""Local benchmarking helpers for the node editor backend."""
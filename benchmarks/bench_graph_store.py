@@ -0,0 +1,77 @@
+"""Save/load latency of GraphStore for graphs of growing size.
+
+    python -m benchmarks.bench_graph_store [--sizes 10 1000 50000] [--repeat 5]
+
+For each size it reports the median time of: the first save, a full save after
+moving one node (new version, all other node payloads deduplicated), a full
+save of an unchanged graph (no new version), a one-op patch moving one node,
+and a load of the latest version, both decoded and as the raw JSON document
+served by GET /api/nodes.
+"""
+from services.graph_store import GraphStore
+from benchmarks.synthetic import make_graph
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def bench_size(store: GraphStore, size: int, repeat: int) -> dict:
+    graph_id = f'bench-{size}'
+    graph = make_graph(size)
+
+    start = time.perf_counter()
+    store.save(graph_id, graph)
+    first_save = (time.perf_counter() - start) * 1000
+
+    def save_moved():
+        graph['nodes'][0]['x'] += 1
+        store.save(graph_id, graph)
+
+    def patch_moved():
+        graph['nodes'][0]['x'] += 1
+        store.apply_patch(graph_id, store.latest_version(graph_id), [
+            {'op': 'moveNode', 'id': graph['nodes'][0]['id'],
+             'x': graph['nodes'][0]['x'], 'y': graph['nodes'][0]['y']}])
+
+    return {
+        'nodes': len(graph['nodes']),
+        'connections': len(graph['connections']),
+        'first_save_ms': round(first_save, 3),
+        'save_one_moved_ms': _median_ms(save_moved, repeat),
+        'save_unchanged_ms': _median_ms(lambda: store.save(graph_id, graph), repeat),
+        'patch_one_moved_ms': _median_ms(patch_moved, repeat),
+        'load_latest_ms': _median_ms(lambda: store.load(graph_id), repeat),
+        'load_latest_json_ms': _median_ms(lambda: store.load_json(graph_id), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GraphStore save/load benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 50000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        store = GraphStore(db_path)
+        results = [bench_size(store, size, args.repeat) for size in args.sizes]
+        store.close()
+        results_db_mb = os.path.getsize(db_path) / 1e6
+
+    print(json.dumps({'results': results, 'db_size_mb': round(results_db_mb, 2)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Request latency as a function of log volume, before and after the queue pipeline.
+
+    python -m benchmarks.bench_logging [--lines 0 10 100] [--requests 500] [--threads 4]
+
+A test route logs ``--lines`` INFO records per request, each carrying ~200
+characters. ``threads`` clients call it concurrently through the Flask test
+client, once with the previous setup (a synchronous RotatingFileHandler with
+maxBytes=10240 on the request path) and once with logging_config's
+QueueHandler pipeline. The report gives p50/p99 request latency per setup and
+log volume, plus the number of records the pipeline dropped because its queue
+was full. Log files go to a temporary directory.
+"""
+from logging.handlers import RotatingFileHandler
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+bench_logger = logging.getLogger('benchmarks.bench_logging')
+LINE = 'x' * 200
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 3)
+
+
+def make_app():
+    from app import create_app
+    from flask import request
+
+    app = create_app()
+
+    @app.route('/bench-log')
+    def bench_log():
+        for i in range(int(request.args.get('lines', 0))):
+            bench_logger.info("bench line %s %s", i, LINE)
+        return 'ok'
+
+    return app
+
+
+def install_legacy(log_dir):
+    """The previous setup_logging: synchronous 10KB rotating file handler"""
+    handler = RotatingFileHandler(os.path.join(log_dir, 'legacy.log'), maxBytes=10240, backupCount=10)
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    return lambda: (root.removeHandler(handler), handler.close())
+
+
+def run(app, lines, requests, threads):
+    latencies, lock = [], threading.Lock()
+
+    def client(count):
+        test_client = app.test_client()
+        local = []
+        for _ in range(count):
+            start = time.perf_counter()
+            test_client.get(f'/bench-log?lines={lines}')
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=client, args=(requests // threads,)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return {'p50_ms': _percentile(latencies, 50), 'p99_ms': _percentile(latencies, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Request latency vs log volume')
+    parser.add_argument('--lines', type=int, nargs='+', default=[0, 10, 100])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        os.environ['LOG_FILE'] = os.path.join(log_dir, 'app.log')
+        os.environ.setdefault('METRICS_DIR', '')
+        os.environ.setdefault('GRAPH_DB_PATH', os.path.join(log_dir, 'graphs.db'))
+        import logging_config
+
+        app = make_app()
+        results = []
+        for lines in args.lines:
+            # Legacy: take the queue handler out and log synchronously
+            logging.getLogger().removeHandler(logging_config.pipeline.handler)
+            restore = install_legacy(log_dir)
+            legacy = run(app, lines, args.requests, args.threads)
+            restore()
+            logging.getLogger().addHandler(logging_config.pipeline.handler)
+
+            dropped_before = logging_config.pipeline.dropped
+            queued = run(app, lines, args.requests, args.threads)
+            queued['dropped_records'] = logging_config.pipeline.dropped - dropped_before
+            results.append({'lines_per_request': lines, 'legacy_sync': legacy, 'queue_pipeline': queued})
+        logging_config.pipeline.stop()
+
+    print(json.dumps({'requests': args.requests, 'threads': args.threads, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Latency of GET /api/nodes while many generation requests are in flight.
+
+    python -m benchmarks.bench_serving [--worker-classes sync gthread] [--generators 32]
+
+For each gunicorn worker class it starts the app with gunicorn.conf.py,
+pointed at the stub OpenAI server (``--latency`` seconds per completion,
+template cache disabled). It then probes GET /api/nodes, first on an idle
+server and then while ``--generators`` clients keep POSTing to
+/api/generate-template. It reports p50/p95/p99 probe latency, timeouts and
+the generation responses by status code. Must be run from the repository
+root.
+"""
+from benchmarks.stub_openai import start_stub_server
+from collections import Counter
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _request(url, body=None, timeout=10.0):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 2)
+
+
+def probe(base_url, duration, interval, timeout):
+    latencies, timeouts = [], 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            _request(f'{base_url}/api/nodes', timeout=timeout)
+            latencies.append((time.perf_counter() - start) * 1000)
+        except OSError:
+            timeouts += 1
+        time.sleep(interval)
+    result = {'probes': len(latencies), 'timeouts': timeouts}
+    if latencies:
+        result.update(p50_ms=_percentile(latencies, 50), p95_ms=_percentile(latencies, 95),
+                      p99_ms=_percentile(latencies, 99), max_ms=round(max(latencies), 2),
+                      mean_ms=round(statistics.mean(latencies), 2))
+    return result
+
+
+def _wait_until_up(base_url, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            _request(f'{base_url}/api/nodes', timeout=1.0)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start in time')
+
+
+def bench_worker_class(worker_class, args, stub_url):
+    # gunicorn turns sync workers into gthread ones when threads > 1
+    threads = args.threads if worker_class == 'gthread' else 1
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            HOST='127.0.0.1', PORT=str(port),
+            WEB_WORKER_CLASS=worker_class, WEB_WORKERS=str(args.workers),
+            WEB_THREADS=str(threads),
+            OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY', 'stub'),
+            OPENAI_BASE_URL=stub_url, OPENAI_RATE_LIMIT_RPS='0',
+            OPENAI_MAX_CONCURRENCY=str(args.generators),
+            TEMPLATE_CACHE_TTL_SECONDS='0', TEMPLATE_CACHE_DIR='',
+            GRAPH_DB_PATH=os.path.join(tmp, 'graphs.db'),
+        )
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_until_up(base_url, process)
+            idle = probe(base_url, args.duration, args.interval, args.probe_timeout)
+
+            stop = threading.Event()
+            statuses = Counter()
+            lock = threading.Lock()
+
+            def generate():
+                while not stop.is_set():
+                    try:
+                        status = _request(f'{base_url}/api/generate-template',
+                                          {'fields': {'vendedor': [], 'comprador': []}},
+                                          timeout=args.latency * 10)
+                    except OSError:
+                        status = 'timeout'
+                    with lock:
+                        statuses[str(status)] += 1
+                    if status == 503:
+                        time.sleep(0.2)
+
+            generators = [threading.Thread(target=generate, daemon=True)
+                          for _ in range(args.generators)]
+            for thread in generators:
+                thread.start()
+            time.sleep(args.latency / 2)
+            loaded = probe(base_url, args.duration, args.interval, args.probe_timeout)
+            stop.set()
+            for thread in generators:
+                thread.join()
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    return {
+        'worker_class': worker_class,
+        'workers': args.workers,
+        'threads': threads,
+        'idle_nodes': idle,
+        'loaded_nodes': loaded,
+        'generation_responses': dict(statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/api/nodes latency under generation load')
+    parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gthread'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--generators', type=int, default=32,
+                        help='concurrent clients calling /api/generate-template')
+    parser.add_argument('--latency', type=float, default=2.0, help='stub completion latency (s)')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per probe phase')
+    parser.add_argument('--interval', type=float, default=0.02, help='pause between probes (s)')
+    parser.add_argument('--probe-timeout', type=float, default=5.0)
+    args = parser.parse_args()
+
+    server, stub_url = start_stub_server('127.0.0.1', 0, latency=args.latency)
+    try:
+        results = [bench_worker_class(worker_class, args, stub_url)
+                   for worker_class in args.worker_classes]
+    finally:
+        server.shutdown()
+    print(json.dumps({'stub_latency_s': args.latency, 'generators': args.generators,
+                      'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Render cost of the compiled template renderer against the regex approach.
+
+    python -m benchmarks.bench_template_renderer [--parties 10 100 500] [--repeat 50]
+
+For each party count it renders a contract template with that many sellers
+and as many buyers, and reports the median time of ``regex_render_ms`` (a
+Python port of replaceFieldValues in docBuilderRenderer.js, which re-runs both
+regexes on every render) and ``compiled_render_ms`` (services.template_renderer,
+which parses the template once and then walks the cached compiled form).
+"""
+from services.template_renderer import compile_template, render_template
+import argparse
+import json
+import re
+import statistics
+import time
+
+EACH_PATTERN = re.compile(r'\{\{#each ([^}]+)\}\}([\s\S]*?)\{\{/each\}\}')
+THIS_FIELD_PATTERN = re.compile(r'\{\{this\.([^}]+)\}\}')
+
+PARTY_BLOCK = (
+    '{{this.name}} {{this.lastname}}, de nacionalidad {{this.nationality}}, '
+    'nacido el {{this.dateOfBirth}}, con documento {{this.docNumber}} y '
+    'domicilio en {{this.address}}'
+)
+
+TEMPLATE = (
+    'CONTRATO DE COMPRAVENTA\n\n'
+    'En la ciudad de Buenos Aires, entre:\n\n'
+    'VENDEDOR/ES:\n{{#each vendedor}}' + PARTY_BLOCK + '{{/each}}\n\n'
+    'y\n\n'
+    'COMPRADOR/ES:\n{{#each comprador}}' + PARTY_BLOCK + '{{/each}}\n\n'
+    'Las partes acuerdan celebrar el presente contrato sujeto a las '
+    'siguientes clausulas.\n' * 3
+)
+
+
+def regex_render(template, fields):
+    """Python port of replaceFieldValues in docBuilderRenderer.js"""
+    def replace_each(match):
+        array = fields
+        for part in match.group(1).split('.'):
+            array = array.get(part) if isinstance(array, dict) else None
+        body = match.group(2)
+
+        def replace_field(item):
+            return lambda m: f'<span class="highlight">{item.get(m.group(1)) or "No disponible"}</span>'
+
+        return '\n'.join(THIS_FIELD_PATTERN.sub(replace_field(item), body) for item in array or [])
+
+    return EACH_PATTERN.sub(replace_each, template)
+
+
+def make_fields(parties: int) -> dict:
+    def party(i):
+        return {
+            'name': f'Nombre{i}', 'lastname': f'Apellido{i}', 'nationality': 'Argentina',
+            'dateOfBirth': '1980-01-01', 'docNumber': str(30000000 + i),
+            # One missing field per party exercises the fallback
+            'address': '' if i % 5 == 0 else f'Calle {i}',
+        }
+    return {
+        'vendedor': [party(i) for i in range(parties)],
+        'comprador': [party(i + parties) for i in range(parties)],
+    }
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 4)
+
+
+def bench_parties(parties: int, repeat: int) -> dict:
+    fields = make_fields(parties)
+    compile_template.cache_clear()
+    start = time.perf_counter()
+    compile_template(TEMPLATE)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    regex_ms = _median_ms(lambda: regex_render(TEMPLATE, fields), repeat)
+    compiled_ms = _median_ms(lambda: render_template(TEMPLATE, fields), repeat)
+    return {
+        'parties_per_side': parties,
+        'template_chars': len(TEMPLATE),
+        'compile_once_ms': round(compile_ms, 4),
+        'regex_render_ms': regex_ms,
+        'compiled_render_ms': compiled_ms,
+        'speedup': round(regex_ms / compiled_ms, 2) if compiled_ms else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Template renderer benchmark')
+    parser.add_argument('--parties', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    print(json.dumps({'results': [bench_parties(p, args.repeat) for p in args.parties]},
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
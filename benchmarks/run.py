@@ -0,0 +1,256 @@
+"""End-to-end load test of the app against the stub OpenAI server.
+
+    python -m benchmarks.run [--sizes 10 1000 10000] [--concurrency 1 4 16 64]
+                             [--duration 3] [--latency 0.5] [--error-rate 0.05]
+                             [--output baseline.json] [--compare baseline.json]
+
+The app is built with ``create_app()`` and served over real HTTP by a
+threaded werkzeug server, in a separate process so that the load generator
+does not compete with it for the GIL. It talks to the stub chat-completions
+server from benchmarks.stub_openai (``--latency``, ``--chunk-delay``,
+``--error-rate``, ``--rate-limit-rate``). Everything it writes goes to a
+temporary directory.
+
+Scenarios (each point runs ``--duration`` seconds with N concurrent clients):
+
+* ``nodes_post`` / ``nodes_get``: full save and full load of synthetic graphs
+  of each ``--sizes`` node count, at each ``--concurrency`` level up to
+  ``--nodes-max-concurrency``.
+* ``generate`` / ``generate_stream``: /api/generate-template and its SSE
+  variant at each ``--concurrency`` level, with the template cache disabled.
+  Identical concurrent prompts are still coalesced, so ``upstream_requests``
+  is reported next to the request count.
+
+Every point reports requests, errors, req/s and p50/p95/p99/max latency in
+milliseconds. ``--output`` saves the JSON report. ``--compare`` matches the
+points of an earlier report and exits with status 1 if the req/s of any point
+dropped, or its p95 rose, by more than ``--tolerance``.
+"""
+from benchmarks.stub_openai import start_stub_server
+from benchmarks.synthetic import make_graph
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def _serve(port_queue):
+    """Child process: build the app and serve it until terminated"""
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def _request(method, url, body=None, timeout=120.0):
+    data = body if isinstance(body, bytes) or body is None else json.dumps(body).encode('utf-8')
+    req = urllib.request.Request(url, data=data, method=method,
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as exc:
+        exc.read()
+        return exc.code
+
+
+def _percentile(ordered, pct):
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 3)
+
+
+def run_point(send, concurrency, duration):
+    """Call ``send()`` from ``concurrency`` threads for ``duration`` seconds"""
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = send() < 400
+            except OSError:
+                ok = False
+            local.append((time.perf_counter() - start) * 1000)
+            failed += not ok
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    result = {'concurrency': concurrency, 'requests': len(ordered), 'errors': errors[0],
+              'rps': round(len(ordered) / elapsed, 2)}
+    if ordered:
+        result.update(p50_ms=_percentile(ordered, 50), p95_ms=_percentile(ordered, 95),
+                      p99_ms=_percentile(ordered, 99), max_ms=round(ordered[-1], 3),
+                      mean_ms=round(statistics.mean(ordered), 3))
+    return result
+
+
+def bench_nodes(base_url, args):
+    results = []
+    for size in args.sizes:
+        graph = make_graph(size)
+        graph_id = f'bench-{size}'
+        payload = json.dumps(graph).encode('utf-8')
+        levels = [c for c in args.concurrency if c <= args.nodes_max_concurrency]
+
+        # Saves alternate between two payloads so every POST stores a new version
+        graph['nodes'][0]['x'] += 1
+        payloads = [payload, json.dumps(graph).encode('utf-8')]
+        counter = iter(range(10 ** 12))
+
+        def post():
+            return _request('POST', f'{base_url}/api/nodes/{graph_id}', payloads[next(counter) % 2])
+
+        def get():
+            return _request('GET', f'{base_url}/api/nodes/{graph_id}')
+
+        for concurrency in levels:
+            point = run_point(post, concurrency, args.duration)
+            results.append({'scenario': 'nodes_post', 'size': size, **point})
+        for concurrency in levels:
+            point = run_point(get, concurrency, args.duration)
+            results.append({'scenario': 'nodes_get', 'size': size, **point})
+    return results
+
+
+def bench_generate(base_url, stub, args):
+    body = {'fields': {'vendedor': [{'name': 'Ana', 'surname': 'Diaz', 'dni': '1', 'address': 'X'}],
+                       'comprador': []}}
+
+    def generate():
+        return _request('POST', f'{base_url}/api/generate-template', body)
+
+    def generate_stream():
+        # SSE errors arrive as an ``error`` event inside a 200 response
+        req = urllib.request.Request(f'{base_url}/api/generate-template/stream',
+                                     data=json.dumps(body).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                text = response.read()
+                return 502 if b'event: error' in text else response.status
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return exc.code
+
+    results = []
+    for scenario, send in (('generate', generate), ('generate_stream', generate_stream)):
+        for concurrency in args.concurrency:
+            upstream_before = stub.request_count
+            point = run_point(send, concurrency, args.duration)
+            point['upstream_requests'] = stub.request_count - upstream_before
+            results.append({'scenario': scenario, **point})
+    return results
+
+
+def compare(report, baseline, tolerance):
+    """Return the points that regressed against ``baseline`` beyond ``tolerance``"""
+    def key(point):
+        return point['scenario'], point.get('size'), point['concurrency']
+
+    previous = {key(point): point for point in baseline.get('results', [])}
+    regressions = []
+    for point in report['results']:
+        old = previous.get(key(point))
+        if not old or not old.get('rps') or 'p95_ms' not in old or 'p95_ms' not in point:
+            continue
+        rps_change = point['rps'] / old['rps'] - 1
+        p95_change = point['p95_ms'] / old['p95_ms'] - 1 if old['p95_ms'] else 0
+        point['vs_baseline'] = {'rps': round(rps_change, 3), 'p95': round(p95_change, 3)}
+        if rps_change < -tolerance or p95_change > tolerance:
+            regressions.append({'scenario': point['scenario'], 'size': point.get('size'),
+                                'concurrency': point['concurrency'], **point['vs_baseline']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load test against the stub upstream')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--nodes-max-concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per point')
+    parser.add_argument('--scenarios', nargs='+', default=['nodes', 'generate'],
+                        choices=['nodes', 'generate'])
+    parser.add_argument('--latency', type=float, default=0.5, help='stub completion latency (s)')
+    parser.add_argument('--chunk-delay', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--compare', help='earlier JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_server(
+        '127.0.0.1', 0, latency=args.latency, chunk_delay=args.chunk_delay,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(
+            OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY', 'stub'),
+            OPENAI_BASE_URL=stub_url,
+            GRAPH_DB_PATH=os.path.join(tmp, 'graphs.db'),
+            LOG_FILE=os.path.join(tmp, 'app.log'),
+            METRICS_DIR='',
+            TEMPLATE_CACHE_TTL_SECONDS='0', TEMPLATE_CACHE_DIR='',
+            DEBUG='false',
+        )
+        context = multiprocessing.get_context('spawn')
+        port_queue = context.Queue()
+        server = context.Process(target=_serve, args=(port_queue,), daemon=True)
+        server.start()
+        try:
+            base_url = f'http://127.0.0.1:{port_queue.get(timeout=60)}'
+            results = []
+            if 'nodes' in args.scenarios:
+                results += bench_nodes(base_url, args)
+            if 'generate' in args.scenarios:
+                results += bench_generate(base_url, stub, args)
+        finally:
+            server.terminate()
+            server.join()
+            stub.shutdown()
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'settings': {'duration_s': args.duration, 'stub_latency_s': args.latency,
+                     'stub_error_rate': args.error_rate,
+                     'stub_rate_limit_rate': args.rate_limit_rate},
+        'results': results,
+    }
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
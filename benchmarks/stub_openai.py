@@ -0,0 +1,211 @@
+"""Minimal stand-in for the OpenAI chat-completions API.
+
+Run it and point the app at it to exercise the upstream handling without a
+real API key or network access:
+
+    python -m benchmarks.stub_openai --port 8001 --latency 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub python app.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+DEFAULT_TEMPLATE = """Contrato de compraventa:
+
+VENDEDORES:
+{{#each vendedor}}
+- {{this.name}} {{this.surname}}, con DNI {{this.dni}}, domiciliado en {{this.address}}
+{{/each}}
+
+COMPRADORES:
+{{#each comprador}}
+- {{this.name}} {{this.surname}}, con DNI {{this.dni}}, domiciliado en {{this.address}}
+{{/each}}"""
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers POST /v1/chat/completions with a canned template after ``server.latency`` seconds
+
+    Requests with ``"stream": true`` get the template back as SSE chunks,
+    ``server.chunk_delay`` seconds apart.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path.rstrip('/') not in ('/v1/chat/completions', '/chat/completions'):
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+            return
+
+        with self.server.lock:
+            self.server.request_count += 1
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        roll = random.random()
+        if roll < self.server.rate_limit_rate:
+            with self.server.lock:
+                self.server.error_count += 1
+            self._send_json(429, {'error': {'message': 'Rate limit reached (stub)', 'type': 'rate_limit'}},
+                            headers={'Retry-After': '1'})
+            return
+        if roll < self.server.rate_limit_rate + self.server.error_rate:
+            with self.server.lock:
+                self.server.error_count += 1
+            self._send_json(500, {'error': {'message': 'Internal error (stub)', 'type': 'server_error'}})
+            return
+
+        content = self.server.template
+        usage = {
+            'prompt_tokens': _count_tokens(body.get('messages', [])),
+            'completion_tokens': len(content.split()),
+            'total_tokens': _count_tokens(body.get('messages', [])) + len(content.split())
+        }
+        if body.get('stream'):
+            include_usage = (body.get('stream_options') or {}).get('include_usage')
+            self._send_stream(body.get('model', 'stub'), content, usage if include_usage else None)
+            return
+
+        self._send_json(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': usage
+        })
+
+    def _send_stream(self, model: str, content: str, usage: Optional[dict] = None) -> None:
+        """Send the content word by word as chat.completion.chunk events, then
+        ``usage`` in a final chunk without choices when it is given"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        words = content.split(' ')
+        try:
+            for i, word in enumerate(words):
+                piece = word if i == len(words) - 1 else word + ' '
+                self._write_event(_chunk(completion_id, model, {'content': piece}, None))
+                if self.server.chunk_delay:
+                    time.sleep(self.server.chunk_delay)
+            self._write_event(_chunk(completion_id, model, {}, 'stop'))
+            if usage is not None:
+                self._write_event({**_chunk(completion_id, model, {}, None), 'choices': [], 'usage': usage})
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream
+            pass
+
+    def _write_event(self, payload: dict) -> None:
+        self.wfile.write(f'data: {json.dumps(payload)}\n\n'.encode('utf-8'))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason) -> dict:
+    return {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+    }
+
+
+def _count_tokens(messages) -> int:
+    """Rough whitespace token count, good enough for usage accounting in tests"""
+    return sum(len(str(m.get('content', '')).split()) for m in messages)
+
+
+def start_stub_server(host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                      template: str = DEFAULT_TEMPLATE, chunk_delay: float = 0.0,
+                      verbose: bool = False, error_rate: float = 0.0,
+                      rate_limit_rate: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the stub in a daemon thread and return ``(server, base_url)``.
+
+    ``error_rate`` and ``rate_limit_rate`` are the fractions of requests answered
+    with a 500 and with a 429 (``Retry-After: 1``) respectively.
+
+    Call ``server.shutdown()`` to stop it. ``server.request_count`` holds the
+    number of completions requested so far and ``server.error_count`` how many
+    of them got an injected error.
+    """
+    server = ThreadingHTTPServer((host, port), StubOpenAIHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.template = template
+    server.chunk_delay = chunk_delay
+    server.verbose = verbose
+    server.error_rate = error_rate
+    server.rate_limit_rate = rate_limit_rate
+    server.request_count = 0
+    server.error_count = 0
+    server.lock = threading.Lock()
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://{host}:{server.server_address[1]}/v1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.5,
+                        help='seconds to wait before answering each request')
+    parser.add_argument('--chunk-delay', type=float, default=0.02,
+                        help='seconds between streamed chunks')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help='fraction of requests answered with 429')
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.host, args.port, args.latency,
+                                         chunk_delay=args.chunk_delay, verbose=True,
+                                         error_rate=args.error_rate,
+                                         rate_limit_rate=args.rate_limit_rate)
+    print(f'Stub OpenAI API listening on {base_url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
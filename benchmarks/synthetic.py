@@ -0,0 +1,68 @@
+"""Synthetic node graphs shaped like the ones the editor produces."""
+from typing import Any, Dict
+
+
+def dni_node(node_id: int, x: int = 0, y: int = 0) -> Dict[str, Any]:
+    return {
+        'id': node_id,
+        'x': x,
+        'y': y,
+        'width': 375,
+        'height': 100,
+        'type': 'dni',
+        'title': f'DNI {node_id}',
+        'state': 'validated',
+        'inputs': [{'id': f'in_{node_id}', 'name': 'Input'}],
+        'outputs': [{'id': f'out_{node_id}', 'name': 'Output'}],
+        'data': {
+            'name': f'Nombre{node_id}',
+            'surname': f'Apellido{node_id}',
+            'dateOfBirth': '1980-01-01',
+            'dni': str(20000000 + node_id),
+            'address': f'Calle {node_id}'
+        }
+    }
+
+
+def doc_builder_node(node_id: int, x: int = 0, y: int = 0) -> Dict[str, Any]:
+    return {
+        'id': node_id,
+        'x': x,
+        'y': y,
+        'width': 375,
+        'height': 150,
+        'type': 'DocBuilder',
+        'title': 'DocBuilder empty',
+        'state': 'inputs_connected',
+        'inputs': [
+            {'id': f'in_{node_id}_vendedor', 'name': 'Vendedor'},
+            {'id': f'in_{node_id}_comprador', 'name': 'Comprador'}
+        ],
+        'outputs': [{'id': f'out_{node_id}', 'name': 'Output'}],
+        'data': None
+    }
+
+
+def make_graph(node_count: int) -> Dict[str, Any]:
+    """Build a graph of roughly ``node_count`` nodes.
+
+    Nodes come in groups of three: a vendor DNI, a buyer DNI and a DocBuilder
+    wired to both, so the graph has about two connections per three nodes.
+    """
+    nodes, connections = [], []
+    node_id = 1
+    while len(nodes) < node_count:
+        group = len(nodes) // 3
+        x, y = (group % 50) * 400, (group // 50) * 300
+        vendor, buyer, doc = node_id, node_id + 1, node_id + 2
+        nodes.append(dni_node(vendor, x, y))
+        if len(nodes) < node_count:
+            nodes.append(dni_node(buyer, x, y + 120))
+        if len(nodes) < node_count:
+            nodes.append(doc_builder_node(doc, x + 200, y))
+            connections.append({'id': f'out_{vendor}-in_{doc}_vendedor',
+                                'source': f'out_{vendor}', 'target': f'in_{doc}_vendedor'})
+            connections.append({'id': f'out_{buyer}-in_{doc}_comprador',
+                                'source': f'out_{buyer}', 'target': f'in_{doc}_comprador'})
+        node_id += 3
+    return {'nodes': nodes, 'connections': connections}
@@ -8,6 +8,8 @@ class Settings(BaseSettings):
 
     # Optional with defaults
     OPENAI_MODEL: str = Field("gpt-3.5-turbo", env="OPENAI_MODEL")
+    # Override to point at a proxy or a local stub server; empty uses the default API
+    OPENAI_BASE_URL: str = Field("", env="OPENAI_BASE_URL")
     DEBUG: bool = Field(True, env="DEBUG")
     PORT: int = Field(5001, env="PORT")
     HOST: str = Field("0.0.0.0", env="HOST")
@@ -18,6 +20,94 @@ class Settings(BaseSettings):
     # In production, specify exact origins
     CORS_ORIGINS: str = Field("*", env="CORS_ORIGINS")
 
+    # Upstream OpenAI connection handling (per worker process)
+    OPENAI_CONNECT_TIMEOUT: float = Field(5.0, env="OPENAI_CONNECT_TIMEOUT")
+    OPENAI_READ_TIMEOUT: float = Field(60.0, env="OPENAI_READ_TIMEOUT")
+    OPENAI_MAX_CONCURRENCY: int = Field(8, env="OPENAI_MAX_CONCURRENCY")
+    # Seconds a request may wait for a concurrency slot or rate-limit token
+    OPENAI_QUEUE_TIMEOUT: float = Field(30.0, env="OPENAI_QUEUE_TIMEOUT")
+    # Requests per second; 0 disables the rate limiter
+    OPENAI_RATE_LIMIT_RPS: float = Field(5.0, env="OPENAI_RATE_LIMIT_RPS")
+    OPENAI_RATE_LIMIT_BURST: int = Field(10, env="OPENAI_RATE_LIMIT_BURST")
+    OPENAI_MAX_RETRIES: int = Field(3, env="OPENAI_MAX_RETRIES")
+    OPENAI_RETRY_BASE_DELAY: float = Field(0.5, env="OPENAI_RETRY_BASE_DELAY")
+    OPENAI_RETRY_MAX_DELAY: float = Field(8.0, env="OPENAI_RETRY_MAX_DELAY")
+    # Retries per second shared by all calls, so an error storm fails fast
+    # instead of multiplying upstream load; 0 disables the budget
+    OPENAI_RETRY_BUDGET_RPS: float = Field(1.0, env="OPENAI_RETRY_BUDGET_RPS")
+    OPENAI_RETRY_BUDGET_BURST: int = Field(10, env="OPENAI_RETRY_BUDGET_BURST")
+
+    # SQLite database holding the saved node graphs
+    GRAPH_DB_PATH: str = Field("data/graphs.db", env="GRAPH_DB_PATH")
+
+    # Generated template cache
+    TEMPLATE_CACHE_MAX_ENTRIES: int = Field(
+        256, env="TEMPLATE_CACHE_MAX_ENTRIES")
+    TEMPLATE_CACHE_TTL_SECONDS: int = Field(
+        24 * 60 * 60, env="TEMPLATE_CACHE_TTL_SECONDS")
+    # Directory for the on-disk tier; empty disables it
+    TEMPLATE_CACHE_DIR: str = Field("", env="TEMPLATE_CACHE_DIR")
+
+    # Serving (gunicorn.conf.py). gthread workers serve each request on a
+    # thread, so a slow upstream call holds one thread instead of a whole worker
+    WEB_WORKERS: int = Field(2, env="WEB_WORKERS")
+    WEB_WORKER_CLASS: str = Field("gthread", env="WEB_WORKER_CLASS")
+    WEB_THREADS: int = Field(32, env="WEB_THREADS")
+    WEB_TIMEOUT: int = Field(120, env="WEB_TIMEOUT")
+    # Generation requests one worker serves at once; the rest get 503 so that
+    # at least WEB_THREADS minus this many threads stay free for other routes.
+    # 0 disables the limit
+    GENERATION_MAX_INFLIGHT: int = Field(16, env="GENERATION_MAX_INFLIGHT")
+
+    # Response compression (see http_caching.py); brotli needs the optional
+    # brotli package
+    COMPRESSION_MIN_SIZE: int = Field(1024, env="COMPRESSION_MIN_SIZE")
+    COMPRESSION_LEVEL: int = Field(6, env="COMPRESSION_LEVEL")
+    COMPRESSION_BROTLI_QUALITY: int = Field(4, env="COMPRESSION_BROTLI_QUALITY")
+    # Seconds between rescans of the static folder for a new build
+    # fingerprint outside debug mode; 0 scans only at startup
+    STATIC_BUILD_RECHECK_SECONDS: int = Field(0, env="STATIC_BUILD_RECHECK_SECONDS")
+
+    # Prometheus metrics. Each worker writes its snapshot to this directory so
+    # /metrics can merge them; empty keeps metrics per process
+    METRICS_DIR: str = Field("data/metrics", env="METRICS_DIR")
+    METRICS_FLUSH_INTERVAL: float = Field(5.0, env="METRICS_FLUSH_INTERVAL")
+
+    # Logging (see logging_config.py). LOG_FILE may contain {pid} to give each
+    # worker its own file
+    LOG_FILE: str = Field("logs/app.log", env="LOG_FILE")
+    LOG_LEVEL: str = Field("INFO", env="LOG_LEVEL")
+    LOG_MAX_BYTES: int = Field(50 * 1024 * 1024, env="LOG_MAX_BYTES")
+    LOG_BACKUP_COUNT: int = Field(10, env="LOG_BACKUP_COUNT")
+    # Records buffered for the writer thread; more are dropped, never waited on
+    LOG_QUEUE_SIZE: int = Field(10000, env="LOG_QUEUE_SIZE")
+    # Fraction of requests whose payload logs are kept
+    LOG_PAYLOAD_SAMPLE_RATE: float = Field(0.01, env="LOG_PAYLOAD_SAMPLE_RATE")
+    LOG_PAYLOAD_MAX_CHARS: int = Field(2000, env="LOG_PAYLOAD_MAX_CHARS")
+
+    # Bulk generation jobs; progress and results are shared by all workers
+    # through BATCH_DB_PATH, generation threads are per worker process
+    BATCH_DB_PATH: str = Field("data/batch_jobs.db", env="BATCH_DB_PATH")
+    BATCH_MAX_WORKERS: int = Field(8, env="BATCH_MAX_WORKERS")
+    BATCH_MAX_ITEMS: int = Field(1000, env="BATCH_MAX_ITEMS")
+    # Seconds a finished job stays available for polling
+    BATCH_JOB_TTL_SECONDS: int = Field(60 * 60, env="BATCH_JOB_TTL_SECONDS")
+
+    # DNI photo uploads (see services/photo_store.py); processing needs the
+    # optional Pillow package
+    PHOTO_STORE_DIR: str = Field("data/photos", env="PHOTO_STORE_DIR")
+    PHOTO_MAX_BYTES: int = Field(16 * 1024 * 1024, env="PHOTO_MAX_BYTES")
+    # Processes decoding and resizing photos (per worker process)
+    PHOTO_PROCESS_WORKERS: int = Field(2, env="PHOTO_PROCESS_WORKERS")
+    PHOTO_MAX_DIMENSION: int = Field(2048, env="PHOTO_MAX_DIMENSION")
+    PHOTO_THUMBNAIL_SIZE: int = Field(256, env="PHOTO_THUMBNAIL_SIZE")
+    PHOTO_JPEG_QUALITY: int = Field(85, env="PHOTO_JPEG_QUALITY")
+    # Seconds after which another worker may take over a photo whose
+    # processing claim was never released
+    PHOTO_CLAIM_TIMEOUT_SECONDS: int = Field(300, env="PHOTO_CLAIM_TIMEOUT_SECONDS")
+    # Attempts before a photo that keeps crashing its processing is marked failed
+    PHOTO_MAX_ATTEMPTS: int = Field(3, env="PHOTO_MAX_ATTEMPTS")
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,27 @@
+"""Gunicorn settings for production serving.
+
+    gunicorn -c gunicorn.conf.py
+
+Workers default to the gthread class: requests waiting on the model keep a
+thread busy, while other threads of the same worker keep serving the node
+graph API and static files. See WEB_* and GENERATION_MAX_INFLIGHT in config.py.
+"""
+from config import settings
+import glob
+import os
+
+wsgi_app = 'app:create_app()'
+bind = f'{settings.HOST}:{settings.PORT}'
+workers = settings.WEB_WORKERS
+worker_class = settings.WEB_WORKER_CLASS
+threads = settings.WEB_THREADS
+timeout = settings.WEB_TIMEOUT
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    # Drop metric snapshots and the aggregate left by a previous run
+    if settings.METRICS_DIR:
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            os.remove(path)
@@ -0,0 +1,237 @@
+"""Conditional requests, response compression and fingerprinted static files.
+
+``init_app`` wires everything into the Flask app:
+
+* Responses above ``COMPRESSION_MIN_SIZE`` bytes are gzip- or (when the
+  optional ``brotli`` package is installed) brotli-compressed, depending on
+  the request's Accept-Encoding. A strong ETag gets the encoding appended
+  (``"<tag>-gzip"``) because each encoding is a different representation.
+* ``url_for('static', ...)`` builds ``/static/v/<build>/<path>``, where
+  ``<build>`` is a hash over every file in the static folder. Relative ES module
+  imports resolve under the same prefix, and any change to any file produces
+  new URLs, so those responses are served as immutable. Plain ``/static/<path>``
+  URLs still work but must be revalidated. The build is computed once, in
+  ``init_app``; it is recomputed on every request in debug mode and every
+  ``STATIC_BUILD_RECHECK_SECONDS`` otherwise (0 never rechecks).
+* Static files are read, hashed and compressed once, at the highest levels,
+  and kept in memory until their modification time changes.
+"""
+from flask import Flask, Response, abort, request
+from werkzeug.security import safe_join
+from config import settings
+from typing import Dict, Optional, Tuple
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+    'text/css',
+    'text/html',
+    'text/javascript',
+    'text/plain',
+}
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+ENCODING_SUFFIXES = ('gzip', 'br')
+
+
+def etag_matches(etag: str) -> bool:
+    """True if If-None-Match names ``etag`` in any of its encoded variants"""
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return False
+    return any(if_none_match.contains(tag)
+               for tag in (etag, *(f'{etag}-{suffix}' for suffix in ENCODING_SUFFIXES)))
+
+
+def not_modified(etag: str, cache_control: str = REVALIDATE_CACHE_CONTROL) -> Optional[Response]:
+    """Return a 304 response if the client already holds ``etag``, else None"""
+    if not etag_matches(etag):
+        return None
+    response = Response(status=304)
+    # Echo the variant the client holds so its cache entry stays valid
+    if request.if_none_match.star_tag:
+        matched = etag
+    else:
+        matched = next(tag for tag in request.if_none_match.as_set()
+                       if tag == etag or tag.startswith(f'{etag}-'))
+    response.set_etag(matched)
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _preferred_encoding(available=ENCODING_SUFFIXES) -> Optional[str]:
+    accept = request.accept_encodings
+    if brotli is not None and 'br' in available and accept['br']:
+        return 'br'
+    if 'gzip' in available and accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if best else settings.COMPRESSION_LEVEL, mtime=0)
+
+
+def compress_response(response: Response) -> Response:
+    """after_request hook compressing large textual responses"""
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    data = response.get_data()
+    if len(data) < settings.COMPRESSION_MIN_SIZE:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _preferred_encoding()
+    if encoding is None:
+        return response
+
+    response.set_data(_compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
+
+
+class _Asset:
+    __slots__ = ('mtime_ns', 'size', 'etag', 'mimetype', 'variants')
+
+    def __init__(self, path: str, mtime_ns: int, size: int):
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.etag = hashlib.sha256(data).hexdigest()[:32]
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        # encoding -> body; '' is the identity encoding
+        self.variants: Dict[str, bytes] = {'': data}
+        if self.mimetype in COMPRESSIBLE_MIMETYPES and size >= settings.COMPRESSION_MIN_SIZE:
+            for encoding in ENCODING_SUFFIXES:
+                if encoding == 'br' and brotli is None:
+                    continue
+                compressed = _compress(data, encoding, best=True)
+                if len(compressed) < size:
+                    self.variants[encoding] = compressed
+
+
+class StaticAssets:
+    """In-memory cache of the static folder's files, hashes and compressed variants"""
+
+    def __init__(self, root: str, recheck_interval: float = 0):
+        self.root = root
+        self.recheck_interval = recheck_interval
+        self._assets: Dict[str, _Asset] = {}
+        self._build: Optional[Tuple[tuple, str]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, filename: str) -> Optional[_Asset]:
+        path = safe_join(self.root, filename)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        asset = self._assets.get(filename)
+        if asset is None or asset.mtime_ns != stat.st_mtime_ns or asset.size != stat.st_size:
+            asset = _Asset(path, stat.st_mtime_ns, stat.st_size)
+            with self._lock:
+                self._assets[filename] = asset
+        return asset
+
+    def build_version(self, recheck: bool = False) -> str:
+        """Hash over all static files; changes whenever any of them changes.
+
+        The folder is only walked again when ``recheck`` is set or
+        ``recheck_interval`` seconds have passed since the last walk."""
+        build = self._build
+        now = time.monotonic()
+        if build is not None and not recheck and not (
+                self.recheck_interval and now - self._checked_at >= self.recheck_interval):
+            return build[1]
+
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                stat = os.stat(path)
+                files.append((os.path.relpath(path, self.root), stat.st_mtime_ns, stat.st_size))
+        signature = tuple(sorted(files))
+
+        self._checked_at = now
+        if build is not None and build[0] == signature:
+            return build[1]
+        digest = hashlib.sha256()
+        for filename, _, _ in signature:
+            asset = self.get(filename.replace(os.sep, '/'))
+            digest.update(f'{filename}\0{asset.etag if asset else ""}\0'.encode('utf-8'))
+        version = digest.hexdigest()[:12]
+        self._build = (signature, version)
+        return version
+
+
+def init_app(app: Flask) -> None:
+    """Serve static files with fingerprinted URLs and compress responses"""
+    assets = StaticAssets(app.static_folder, settings.STATIC_BUILD_RECHECK_SECONDS)
+    assets.build_version()
+    app.extensions['static_assets'] = assets
+
+    app.add_url_rule(f'{app.static_url_path}/v/<build>/<path:filename>', endpoint='static')
+
+    def serve_static(filename, build=None):
+        asset = assets.get(filename)
+        if asset is None:
+            abort(404)
+
+        cache_control = (IMMUTABLE_CACHE_CONTROL if build is not None and build == assets.build_version(recheck=app.debug)
+                         else REVALIDATE_CACHE_CONTROL)
+        cached = not_modified(asset.etag, cache_control)
+        if cached is not None:
+            return cached
+
+        encoding = _preferred_encoding(tuple(asset.variants))
+        response = Response(asset.variants[encoding or ''], mimetype=asset.mimetype)
+        response.set_etag(f'{asset.etag}-{encoding}' if encoding else asset.etag)
+        response.headers['Cache-Control'] = cache_control
+        if len(asset.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    app.view_functions['static'] = serve_static
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'build' not in values:
+            values['build'] = assets.build_version(recheck=app.debug)
+
+    app.after_request(compress_response)
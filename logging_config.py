@@ -0,0 +1,201 @@
+"""Non-blocking structured logging.
+
+Request threads only put records on a bounded in-memory queue (a
+``QueueHandler`` on the root logger); a background ``QueueListener`` thread
+formats them as JSON lines and writes and rotates the log file. When the
+queue is full, records are dropped and counted instead of blocking the
+request.
+
+Every record carries the id of the request that produced it: the incoming
+``X-Request-ID`` header if present, otherwise a generated one, which is also
+returned in the response's ``X-Request-ID`` header.
+
+Verbose payload logs are records with a ``payload`` extra, e.g.
+``logger.info("Generate request", extra={'payload': data})``. They are kept
+for a sampled fraction of requests (LOG_PAYLOAD_SAMPLE_RATE), with the
+payload truncated to LOG_PAYLOAD_MAX_CHARS characters, and dropped otherwise.
+"""
+from flask import Flask, g, request
+from config import settings
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+
+request_id_var: ContextVar[str] = ContextVar('request_id', default='-')
+payload_sampled_var: ContextVar[bool] = ContextVar('payload_sampled', default=False)
+
+_traceback_formatter = logging.Formatter()
+
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,128}$')
+
+# Attributes of every LogRecord; anything else was passed via ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'request_id', 'payload'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+                  + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'pid': record.process,
+            'module': record.module,
+            'line': record.lineno,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if getattr(record, 'payload', None) is not None:
+            entry['payload'] = record.payload
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _RequestQueueHandler(QueueHandler):
+    """QueueHandler that tags records with the request id, samples payload logs
+    and never blocks the calling thread"""
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        payload = getattr(record, 'payload', None)
+        if payload is not None:
+            if not payload_sampled_var.get():
+                return
+            text = json.dumps(payload, ensure_ascii=False, default=str)
+            if len(text) > settings.LOG_PAYLOAD_MAX_CHARS:
+                record.payload = text[:settings.LOG_PAYLOAD_MAX_CHARS] + '...'
+        record.request_id = request_id_var.get()
+        super().emit(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # SimpleQueue is much cheaper to put on than queue.Queue; the bound is
+        # approximate under concurrency, which is fine for a memory cap
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message here, since its arguments may change once the
+        # request moves on, but leave the formatting to the listener thread.
+        # Only records with a traceback are copied, to keep exc_info intact
+        # for any other handler
+        if record.exc_info:
+            record = copy.copy(record)
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class LoggingPipeline:
+    """Root QueueHandler plus the listener thread that owns the file handler"""
+
+    def __init__(self):
+        self.handler: Optional[_RequestQueueHandler] = None
+        self.listener: Optional[QueueListener] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Install the pipeline on the root logger (idempotent per process)"""
+        with self._lock:
+            if self.listener is not None:
+                return
+            filename = settings.LOG_FILE.format(pid=os.getpid())
+            directory = os.path.dirname(filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            file_handler = RotatingFileHandler(
+                filename, maxBytes=settings.LOG_MAX_BYTES,
+                backupCount=settings.LOG_BACKUP_COUNT, encoding='utf-8', delay=True)
+            file_handler.setFormatter(JsonFormatter())
+
+            log_queue = queue.SimpleQueue()
+            self.handler = _RequestQueueHandler(log_queue, settings.LOG_QUEUE_SIZE)
+            self.listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+            self.listener.start()
+
+            root = logging.getLogger()
+            root.setLevel(settings.LOG_LEVEL)
+            root.addHandler(self.handler)
+            atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Flush queued records and remove the pipeline from the root logger"""
+        with self._lock:
+            if self.listener is None:
+                return
+            logging.getLogger().removeHandler(self.handler)
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+            self.handler = None
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped if self.handler is not None else 0
+
+    def _after_fork(self) -> None:
+        # The listener thread does not survive a fork; start a fresh pipeline
+        if self.listener is not None:
+            logging.getLogger().removeHandler(self.handler)
+            self.listener = None
+            self.handler = None
+            self._lock = threading.Lock()
+            self.start()
+        else:
+            self._lock = threading.Lock()
+
+
+pipeline = LoggingPipeline()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=pipeline._after_fork)
+
+
+def init_app(app: Flask) -> None:
+    """Start the logging pipeline and assign a request id to every request"""
+    pipeline.start()
+
+    @app.before_request
+    def assign_request_id():
+        incoming = request.headers.get('X-Request-ID', '')
+        request_id = incoming if _REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+        # Not reset on teardown: streamed responses keep logging from this thread
+        request_id_var.set(request_id)
+        payload_sampled_var.set(random.random() < settings.LOG_PAYLOAD_SAMPLE_RATE)
+        g.request_id = request_id
+
+    @app.after_request
+    def return_request_id(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        return response
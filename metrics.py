@@ -0,0 +1,475 @@
+"""Prometheus metrics: request timing, upstream model usage and graph sizes.
+
+Metrics live in plain in-process objects, so recording one is a dict lookup
+and an addition under a lock. To make ``/metrics`` cover every gunicorn
+worker, each process periodically writes a snapshot to
+``<METRICS_DIR>/<pid>-<start>.json``, where ``<start>`` is the process start
+time, so a reused pid never overwrites another worker's file. The worker
+answering the scrape refreshes its own file, then merges all of them by
+summing counters and histograms. Snapshots of exited workers are folded into
+``aggregate.json`` and deleted, so counters do not go backwards and the
+directory does not grow with every restarted worker; gunicorn.conf.py clears
+the directory when the server starts. An empty METRICS_DIR keeps metrics per process.
+"""
+from flask import Flask, Response, g, request
+from config import settings
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; exited workers' files are then kept
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AGGREGATE_FILE = 'aggregate.json'
+
+UPSTREAM_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class _Metric(ABC):
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def labels(self, *values: Any):
+        """Return the child for these label values (created on first use)"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def reset(self) -> None:
+        with self._lock:
+            self._children = {}
+
+    def samples(self) -> List[list]:
+        with self._lock:
+            return [[list(key), child.dump()] for key, child in self._children.items()]
+
+    @abstractmethod
+    def _new_child(self):
+        """Return a new child holding the values of one label combination"""
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dump(self):
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ('upper_bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def dump(self):
+        return [list(self.counts), self.sum]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+class MetricsRegistry:
+    """Holds the metrics of this process and merges the snapshots of all workers"""
+
+    def __init__(self, directory: str, flush_interval: float):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics: List[_Metric] = []
+        self._flusher_pid: Optional[int] = None
+        self._snapshot_file: Optional[Tuple[int, str]] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        self.metrics.append(metric)
+
+    def reset(self) -> None:
+        """Drop all recorded values (used in forked children)"""
+        for metric in self.metrics:
+            metric.reset()
+        self._flusher_pid = None
+        self._snapshot_file = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        return {metric.name: metric.samples() for metric in self.metrics}
+
+    def start(self) -> None:
+        """Start this process's background snapshot writer, once per process"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            thread = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            thread.start()
+            atexit.register(self.flush)
+
+    def flush(self) -> None:
+        """Write this process's snapshot to its file"""
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, self._snapshot_name())
+        tmp = f'{path}.tmp'
+        with self._flush_lock:
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(self.snapshot(), f, separators=(',', ':'))
+                os.replace(tmp, path)
+            except OSError as exc:
+                logger.warning("Could not write metrics snapshot %s: %s", path, exc)
+
+    def collect(self) -> Dict[str, List[list]]:
+        """Merge the snapshots of every worker (or return this process's own)"""
+        if not self.directory:
+            return self.snapshot()
+
+        self.flush()
+        types = {metric.name: metric.type for metric in self.metrics}
+        merged: Dict[str, Dict[tuple, Any]] = {name: {} for name in types}
+        with self._directory_lock() as locked:
+            aggregate = self._fold_exited_workers(types) if locked else _read_snapshot(
+                os.path.join(self.directory, AGGREGATE_FILE))
+            folded = set(aggregate.get('folded', ())) if aggregate else set()
+            if aggregate:
+                _merge_into(merged, types, aggregate.get('metrics', {}))
+            for path in glob.glob(os.path.join(self.directory, '*-*.json')):
+                if os.path.basename(path) in folded:
+                    continue
+                snapshot = _read_snapshot(path)
+                if snapshot is not None:
+                    _merge_into(merged, types, snapshot)
+        return _as_snapshot(merged)
+
+    def _fold_exited_workers(self, types: Dict[str, str]) -> Dict[str, Any]:
+        """Add the snapshots of exited workers to the aggregate file and delete them.
+
+        The aggregate names the files it already contains, so a fold that is
+        interrupted before the deletes never counts a snapshot twice. Must be
+        called with the directory lock held."""
+        aggregate_path = os.path.join(self.directory, AGGREGATE_FILE)
+        aggregate = _read_snapshot(aggregate_path) or {'folded': [], 'metrics': {}}
+        folded = set(aggregate['folded'])
+
+        leftovers, exited = [], []
+        for path in glob.glob(os.path.join(self.directory, '*-*.json')):
+            name = os.path.basename(path)
+            if name in folded:
+                leftovers.append(path)
+            elif not _snapshot_owner_alive(name):
+                exited.append(path)
+
+        if exited:
+            merged: Dict[str, Dict[tuple, Any]] = {name: {} for name in types}
+            _merge_into(merged, types, aggregate['metrics'])
+            for path in exited:
+                snapshot = _read_snapshot(path)
+                if snapshot is not None:
+                    _merge_into(merged, types, snapshot)
+            aggregate = {
+                'folded': [name for name in folded
+                           if os.path.exists(os.path.join(self.directory, name))]
+                          + [os.path.basename(path) for path in exited],
+                'metrics': _as_snapshot(merged)
+            }
+            tmp = f'{aggregate_path}.tmp'
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(aggregate, f, separators=(',', ':'))
+                os.replace(tmp, aggregate_path)
+            except OSError as exc:
+                logger.warning("Could not write metrics aggregate %s: %s", aggregate_path, exc)
+                return aggregate
+            logger.info("Folded metrics of %s exited worker(s) into %s", len(exited), aggregate_path)
+
+        for path in leftovers + exited:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        return aggregate
+
+    @contextmanager
+    def _directory_lock(self):
+        """Serialize scrapes across workers; yields False when locking is unavailable"""
+        if fcntl is None:
+            yield False
+            return
+        with open(os.path.join(self.directory, 'aggregate.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _snapshot_name(self) -> str:
+        pid = os.getpid()
+        if self._snapshot_file is None or self._snapshot_file[0] != pid:
+            start = _process_start(pid) or str(time.time_ns())
+            self._snapshot_file = (pid, f'{pid}-{start}.json')
+        return self._snapshot_file[1]
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        collected = self.collect()
+        lines = []
+        for metric in self.metrics:
+            samples = collected.get(metric.name) or []
+            lines.append(f'# HELP {metric.name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for labels, value in sorted(samples):
+                pairs = list(zip(metric.labelnames, labels))
+                if metric.type == 'counter':
+                    lines.append(f'{metric.name}{_labels(pairs)} {_number(value)}')
+                else:
+                    counts, total = value
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float('inf'),), counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else _number(bound)
+                        lines.append(f'{metric.name}_bucket{_labels(pairs + [("le", le)])} {cumulative}')
+                    lines.append(f'{metric.name}_sum{_labels(pairs)} {_number(total)}')
+                    lines.append(f'{metric.name}_count{_labels(pairs)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def _flush_loop(self) -> None:
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+def _process_start(pid: int) -> Optional[str]:
+    """Start time of a running process in clock ticks since boot, or None if
+    it is not running or /proc is unavailable"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces and parentheses; fields after it are fixed
+    return stat.rsplit(b')', 1)[1].split()[19].decode('ascii')
+
+
+def _snapshot_owner_alive(filename: str) -> bool:
+    """Whether the process that writes ``<pid>-<start>.json`` is still running"""
+    pid, _, start = filename[:-len('.json')].partition('-')
+    try:
+        pid = int(pid)
+    except ValueError:
+        return True
+    if os.path.isdir('/proc/self'):
+        return _process_start(pid) == start
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge_into(merged: Dict[str, Dict[tuple, Any]], types: Dict[str, str],
+                snapshot: Dict[str, List[list]]) -> None:
+    """Add a snapshot's samples to ``merged``; counters and histograms are summed"""
+    for name, samples in snapshot.items():
+        if name not in merged:
+            continue
+        series = merged[name]
+        for labels, value in samples:
+            key = tuple(labels)
+            current = series.get(key)
+            if current is None:
+                series[key] = value
+            elif types[name] == 'counter':
+                series[key] = current + value
+            elif len(current[0]) == len(value[0]):
+                series[key] = [[a + b for a, b in zip(current[0], value[0])],
+                               current[1] + value[1]]
+
+
+def _as_snapshot(merged: Dict[str, Dict[tuple, Any]]) -> Dict[str, List[list]]:
+    return {name: [[list(key), value] for key, value in series.items()]
+            for name, series in merged.items()}
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+registry = MetricsRegistry(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.reset)
+
+# HTTP
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by route, method and status code',
+    ('method', 'route', 'status'))
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to produce the response (headers for streamed responses)',
+    ('method', 'route'))
+
+# Upstream model
+OPENAI_REQUESTS = Counter(
+    'openai_requests_total', 'Chat completion requests by model, mode and outcome',
+    ('model', 'mode', 'outcome'))
+OPENAI_REQUEST_DURATION = Histogram(
+    'openai_request_duration_seconds',
+    'Chat completion latency, including limiter queueing and retries',
+    ('model', 'mode'), buckets=UPSTREAM_BUCKETS)
+OPENAI_TOKENS = Counter(
+    'openai_tokens_total', 'Tokens reported by the upstream API', ('model', 'kind'))
+
+# Node graphs
+GRAPH_SAVES = Counter('graph_saves_total', 'Successful graph saves by kind (full or patch)', ('kind',))
+# Sizes are not labeled by graph id: graphs are user-created and unbounded
+GRAPH_NODES = Histogram(
+    'graph_saved_nodes', 'Nodes in the saved version, per successful save', buckets=SIZE_BUCKETS)
+GRAPH_CONNECTIONS = Histogram(
+    'graph_saved_connections', 'Connections in the saved version, per successful save',
+    buckets=SIZE_BUCKETS)
+
+
+class LLMCall:
+    """Context manager recording one upstream call's latency, outcome and token usage"""
+
+    __slots__ = ('model', 'mode', 'start')
+
+    def __init__(self, model: str, mode: str):
+        self.model = model
+        self.mode = mode
+
+    def __enter__(self) -> 'LLMCall':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is GeneratorExit:
+            outcome = 'cancelled'
+        else:
+            outcome = 'error' if exc_type is not None else 'success'
+        OPENAI_REQUEST_DURATION.labels(self.model, self.mode).observe(time.perf_counter() - self.start)
+        OPENAI_REQUESTS.labels(self.model, self.mode, outcome).inc()
+
+    def record_usage(self, usage: Any) -> None:
+        """Add the prompt/completion token counts of an API ``usage`` object"""
+        if usage is None:
+            return
+        prompt = getattr(usage, 'prompt_tokens', None)
+        completion = getattr(usage, 'completion_tokens', None)
+        if prompt:
+            OPENAI_TOKENS.labels(self.model, 'prompt').inc(prompt)
+        if completion:
+            OPENAI_TOKENS.labels(self.model, 'completion').inc(completion)
+
+
+def record_graph_size(kind: str, nodes: int, connections: int) -> None:
+    GRAPH_SAVES.labels(kind).inc()
+    GRAPH_NODES.labels().observe(nodes)
+    GRAPH_CONNECTIONS.labels().observe(connections)
+
+
+def init_app(app: Flask) -> None:
+    """Time every request and serve the merged metrics at /metrics"""
+
+    @app.before_request
+    def start_timer():
+        # Cheap after the first call; covers workers forked from a preloaded app
+        registry.start()
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            HTTP_REQUEST_DURATION.labels(request.method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
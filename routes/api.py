@@ -1,20 +1,52 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, make_response, request, send_file, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
+from config import settings
 from services.openai_service import OpenAIService, OpenAIServiceError
-from services.node_graph_data_service import NodeGraphDataService, NodeGraphDataServiceError
+from services.openai_client import UpstreamBusyError
+from services.batch_generation import BatchGenerationError, batch_generation
+from services.node_graph_data_service import (
+    DEFAULT_GRAPH_ID, GraphVersionConflictError, GraphVersionNotFoundError,
+    InvalidGraphDataError, NodeGraphDataService, NodeGraphDataServiceError)
+from services.photo_store import (
+    PhotoProcessingUnavailableError, PhotoStoreError, PhotoTooLargeError, photo_store)
+from services.template_cache import template_cache
+from services.template_renderer import TemplateRendererError, render_template
+from http_caching import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, not_modified
+from metrics import LLMCall
 from functools import wraps
+import json
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
 # Create blueprint
 api_bp = Blueprint('api', __name__)
 
+# Per-process cap on requests waiting on the model (see GENERATION_MAX_INFLIGHT)
+_generation_slots = (threading.BoundedSemaphore(settings.GENERATION_MAX_INFLIGHT)
+                     if settings.GENERATION_MAX_INFLIGHT > 0 else None)
+
+
+def _busy_response(message):
+    """503 asking the client to retry shortly"""
+    response = jsonify({
+        'status': 'error',
+        'message': message
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 
 def handle_errors(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         try:
             return f(*args, **kwargs)
+        except UpstreamBusyError as e:
+            logger.warning(f"Upstream busy: {str(e)}")
+            return _busy_response(str(e))
         except OpenAIServiceError as e:
             logger.error(f"Service error: {str(e)}")
             return jsonify({
@@ -30,15 +62,44 @@ def handle_errors(f):
     return wrapper
 
 
+def limit_inflight(f):
+    """Reject with 503 when this worker already serves GENERATION_MAX_INFLIGHT
+    generation requests, so they cannot take every thread of the worker"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if _generation_slots is None:
+            return f(*args, **kwargs)
+        if not _generation_slots.acquire(blocking=False):
+            logger.warning("Rejected generation request: too many in flight")
+            return _busy_response('Too many generation requests in progress, retry shortly')
+
+        release_on_close = False
+        try:
+            response = make_response(f(*args, **kwargs))
+            if response.is_streamed:
+                # A streamed body keeps running after the view returns
+                response.call_on_close(_generation_slots.release)
+                release_on_close = True
+            return response
+        finally:
+            if not release_on_close:
+                _generation_slots.release()
+    return wrapper
+
+
 @api_bp.route('/test-openai', methods=['GET'])
 @handle_errors
+@limit_inflight
 def test_openai():
     """Test endpoint to verify OpenAI connectivity"""
     service = OpenAIService()
-    response = service.client.chat.completions.create(
-        model=service.model,
-        messages=[{"role": "user", "content": "Say 'OpenAI is working!'"}]
-    )
+    with LLMCall(service.model, 'test') as call:
+        response = service.limiter.call(
+            service.client.chat.completions.create,
+            model=service.model,
+            messages=[{"role": "user", "content": "Say 'OpenAI is working!'"}]
+        )
+        call.record_usage(response.usage)
     return jsonify({
         'status': 'success',
         'message': response.choices[0].message.content
@@ -47,6 +108,7 @@ def test_openai():
 
 @api_bp.route('/generate-template', methods=['POST'])
 @handle_errors
+@limit_inflight
 def generate_template():
     """Generate a contract template based on provided fields"""
     data = request.get_json()
@@ -57,8 +119,10 @@ def generate_template():
             'message': 'Missing required fields parameter'
         }), 400
 
+    logger.info("Generate template request", extra={'payload': data['fields']})
     service = OpenAIService()
     template = service.generate_contract_template(data['fields'])
+    logger.info("Generate template response", extra={'payload': template})
 
     return jsonify({
         'status': 'success',
@@ -66,18 +130,171 @@ def generate_template():
     })
 
 
-@api_bp.route('/nodes', methods=['GET', 'POST'])
+@api_bp.route('/generate-template/batch', methods=['POST'])
+@handle_errors
+def generate_template_batch():
+    """Start generating many documents; returns a job id to poll for progress"""
+    data = request.get_json()
+
+    if not data or 'items' not in data:
+        return jsonify({
+            'status': 'error',
+            'message': 'Missing required items parameter'
+        }), 400
+
+    try:
+        job = batch_generation.submit(data['items'])
+    except BatchGenerationError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    return jsonify({
+        'status': 'success',
+        **job
+    }), 202
+
+
+@api_bp.route('/generate-template/batch/<job_id>', methods=['GET'])
+@handle_errors
+def generate_template_batch_status(job_id):
+    """Return progress and (partial) results of a batch job; supports ?offset=&limit="""
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    job = batch_generation.get(job_id, max(offset, 0), limit if limit is None else max(limit, 0))
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Unknown batch job {job_id}'
+        }), 404
+
+    return jsonify({
+        'status': 'success',
+        **job
+    })
+
+
+def _sse(data, event=None):
+    """Format one Server-Sent Events message"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@api_bp.route('/generate-template/stream', methods=['POST'])
 @handle_errors
-def handle_nodes():
+@limit_inflight
+def generate_template_stream():
+    """Stream a contract template as Server-Sent Events
+
+    Emits one ``data: {"delta": ...}`` message per chunk, then a ``done`` event,
+    or an ``error`` event if generation fails midway.
+    """
+    data = request.get_json()
+
+    if not data or 'fields' not in data:
+        return jsonify({
+            'status': 'error',
+            'message': 'Missing required fields parameter'
+        }), 400
+
+    logger.info("Stream template request", extra={'payload': data['fields']})
+    service = OpenAIService()
+    chunks = service.stream_contract_template(data['fields'])
+
+    # Wait for the first chunk before answering, so that load shedding
+    # (UpstreamBusyError) still reaches the client as a 503
+    failure = None
+    try:
+        first = next(chunks, None)
+    except OpenAIServiceError as e:
+        first, failure = None, e
+
+    def events():
+        parts = []
+        try:
+            if failure is not None:
+                raise failure
+            if first is not None:
+                parts.append(first)
+                yield _sse({'delta': first})
+            for chunk in chunks:
+                parts.append(chunk)
+                yield _sse({'delta': chunk})
+            logger.info("Stream template response", extra={'payload': ''.join(parts)})
+            yield _sse({'status': 'success'}, event='done')
+        except OpenAIServiceError as e:
+            yield _sse({'status': 'error', 'message': str(e)}, event='error')
+        finally:
+            # Runs on client disconnect too, cancelling the upstream stream
+            chunks.close()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@api_bp.route('/render-template', methods=['POST'])
+@handle_errors
+def render_template_html():
+    """Render a generated template with the given fields to HTML"""
+    data = request.get_json()
+
+    if not data or 'template' not in data or 'fields' not in data:
+        return jsonify({
+            'status': 'error',
+            'message': 'Missing required template or fields parameter'
+        }), 400
+
+    try:
+        html = render_template(data['template'], data['fields'])
+    except TemplateRendererError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    return jsonify({
+        'status': 'success',
+        'html': html
+    })
+
+
+@api_bp.route('/nodes', methods=['GET', 'POST', 'PATCH'])
+@api_bp.route('/nodes/<graph_id>', methods=['GET', 'POST', 'PATCH'])
+@handle_errors
+def handle_nodes(graph_id=DEFAULT_GRAPH_ID):
     """Handle node-related operations
 
-    GET: Returns the default nodes configuration
-    POST: Saves the nodes configuration
+    GET: Returns the latest saved graph (or ``?version=N``), falling back to the
+         default nodes configuration for graphs that were never saved
+    POST: Saves the full nodes configuration as a new version
+    PATCH: Applies ``{"baseVersion": N, "ops": [...]}`` to version N, which must
+           still be the latest version (409 otherwise)
     """
     if request.method == 'GET':
         try:
-            nodes_data = NodeGraphDataService.get_default_node_graph()
-            return jsonify(nodes_data)
+            version = request.args.get('version', type=int)
+            etag = NodeGraphDataService.get_node_graph_etag(graph_id, version)
+            cached = not_modified(etag)
+            if cached is not None:
+                return cached
+
+            document = NodeGraphDataService.get_node_graph_json(graph_id, version)
+            response = Response(document, mimetype='application/json')
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+            return response
+        except GraphVersionNotFoundError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 404
         except NodeGraphDataServiceError as e:
             logger.error(f"Error getting nodes: {str(e)}")
             return jsonify({
@@ -88,22 +305,179 @@ def handle_nodes():
     elif request.method == 'POST':
         try:
             data = request.get_json()
-            if not data or 'nodes' not in data:
+            if not isinstance(data, dict) or 'nodes' not in data:
                 return jsonify({
                     'status': 'error',
                     'message': 'Missing required nodes data'
                 }), 400
 
-            NodeGraphDataService.save_node_graph(data)
+            version = NodeGraphDataService.save_node_graph(data, graph_id)
 
             return jsonify({
                 'status': 'success',
-                'message': 'Nodes saved successfully'
+                'message': 'Nodes saved successfully',
+                'version': version
             })
 
-        except NodGraphDataServiceError as e:
+        except InvalidGraphDataError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        except NodeGraphDataServiceError as e:
             logger.error(f"Error saving nodes: {str(e)}")
             return jsonify({
                 'status': 'error',
                 'message': 'Failed to save nodes configuration'
             }), 500
+
+    elif request.method == 'PATCH':
+        try:
+            data = request.get_json()
+            if not isinstance(data, dict) or type(data.get('baseVersion')) is not int \
+                    or not isinstance(data.get('ops'), list):
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Missing required baseVersion and ops'
+                }), 400
+
+            version = NodeGraphDataService.patch_node_graph(
+                graph_id, data['baseVersion'], data['ops'])
+
+            return jsonify({
+                'status': 'success',
+                'message': 'Nodes saved successfully',
+                'version': version
+            })
+
+        except GraphVersionConflictError as e:
+            return jsonify({
+                'status': 'conflict',
+                'message': str(e),
+                'latestVersion': e.latest_version
+            }), 409
+        except InvalidGraphDataError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        except NodeGraphDataServiceError as e:
+            logger.error(f"Error patching nodes: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': 'Failed to save nodes configuration'
+            }), 500
+
+
+@api_bp.route('/graphs/<graph_id>/versions', methods=['GET'])
+@handle_errors
+def graph_versions(graph_id):
+    """List the saved versions of a graph, newest first"""
+    return jsonify({
+        'status': 'success',
+        'versions': NodeGraphDataService.list_versions(graph_id)
+    })
+
+
+@api_bp.route('/graphs/<graph_id>/evaluate', methods=['GET'])
+@handle_errors
+def evaluate_graph(graph_id):
+    """Resolve the input fields of every DocBuilder node in the latest graph version"""
+    try:
+        result = NodeGraphDataService.evaluate_node_graph(graph_id)
+    except GraphVersionNotFoundError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 404
+    except InvalidGraphDataError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    return jsonify({
+        'status': 'success',
+        **result
+    })
+
+
+@api_bp.route('/template-cache/stats', methods=['GET'])
+@handle_errors
+def template_cache_stats():
+    """Return hit/miss/coalesced counters for the generated template cache"""
+    return jsonify({
+        'status': 'success',
+        'stats': template_cache.stats()
+    })
+
+
+@api_bp.route('/photos', methods=['POST'])
+@handle_errors
+def upload_photo():
+    """Store a DNI photo sent as the raw request body and start processing it
+
+    The body is streamed to disk in chunks rather than parsed as a form, so a
+    worker holds at most one chunk of it in memory. The returned ``photoId``
+    is the SHA-256 of the photo; poll GET /photos/<photoId> until its state is
+    ``ready`` or ``error``.
+    """
+    too_large = {
+        'status': 'error',
+        'message': f'Photo exceeds the {settings.PHOTO_MAX_BYTES} byte limit'
+    }
+    if request.content_length is not None and request.content_length > settings.PHOTO_MAX_BYTES:
+        return jsonify(too_large), 413
+
+    try:
+        photo_id, created = photo_store.save(request.stream)
+    except (PhotoTooLargeError, RequestEntityTooLarge):
+        return jsonify(too_large), 413
+    except PhotoProcessingUnavailableError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 503
+    except PhotoStoreError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 415
+
+    photo = photo_store.status(photo_id)
+    return jsonify({
+        'status': 'success',
+        'created': created,
+        **photo
+    }), 202 if photo['state'] == 'processing' else 200
+
+
+@api_bp.route('/photos/<photo_id>', methods=['GET'])
+@handle_errors
+def photo_status(photo_id):
+    """Return a photo's processing state and, once ready, its dimensions"""
+    photo = photo_store.status(photo_id)
+    if photo is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Unknown photo {photo_id}'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        **photo
+    })
+
+
+@api_bp.route('/photos/<photo_id>/<any(image, thumbnail):variant>', methods=['GET'])
+@handle_errors
+def photo_file(photo_id, variant):
+    """Serve a processed photo or its thumbnail (immutable: the id is a content hash)"""
+    path = photo_store.file_path(photo_id, variant)
+    if path is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Photo {photo_id} is not ready'
+        }), 404
+    response = send_file(path, mimetype='image/jpeg', etag=f'{photo_id}-{variant}')
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
@@ -0,0 +1,216 @@
+from config import settings
+from services.openai_service import OpenAIService
+from services.node_graph_data_service import (
+    NodeGraphDataService, NodeGraphDataServiceError, graph_store)
+from services.template_renderer import render_template
+from services.batch_job_store import BatchJobStore
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+_ABANDONED = "The worker running this job stopped before the document was generated"
+
+
+class BatchGenerationError(Exception):
+    """Raised when a batch request is invalid"""
+    pass
+
+
+class BatchGenerationService:
+    """Generates many documents at once on a bounded thread pool.
+
+    Documents whose prompts are identical share a single upstream request.
+    Job progress and results live in a ``BatchJobStore`` so any worker
+    process can answer a poll; the generations themselves run on the pool of
+    the worker that accepted the job. A job whose worker has exited before
+    finishing has its pending documents failed on the next poll.
+    """
+
+    def __init__(self, store: BatchJobStore, max_workers: int, max_items: int, job_ttl: float):
+        self.store = store
+        self.max_workers = max_workers
+        self.max_items = max_items
+        self.job_ttl = job_ttl
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._token: Optional[str] = None
+
+    def submit(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Expand the request items into documents and start generating them.
+
+        Each item is either ``{"fields": {...}}`` or ``{"graphId": ..., "nodeId": ...}``.
+        A graph item without ``nodeId`` produces one document per DocBuilder
+        node of the graph's latest version. Returns the new job's progress.
+
+        Raises:
+            BatchGenerationError: If the items are malformed or too many
+        """
+        if not isinstance(items, list) or not items:
+            raise BatchGenerationError("items must be a non-empty list")
+
+        documents = self._expand(items)
+        if len(documents) > self.max_items:
+            raise BatchGenerationError(
+                f"Batch expands to {len(documents)} documents; the limit is {self.max_items}")
+
+        service = OpenAIService()
+        groups: Dict[str, List[int]] = {}
+        for index, document in enumerate(documents):
+            if document['status'] == 'pending':
+                groups.setdefault(service.cache_key(document['fields']), []).append(index)
+
+        executor, token = self._get_executor()
+        self._evict_expired()
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id,
+                          [{k: v for k, v in d.items() if k != 'fields'} for d in documents],
+                          len(groups), os.getpid(), token)
+
+        for indexes in groups.values():
+            group = [(index, documents[index]) for index in indexes]
+            future = executor.submit(service.generate_contract_template, group[0][1]['fields'])
+            future.add_done_callback(lambda f, g=group: self._on_done(job_id, g, f))
+
+        logger.info("Started batch job %s (%s documents, %s unique prompts)",
+                    job_id, len(documents), len(groups))
+        return self.get(job_id, limit=0)
+
+    def get(self, job_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Return a job's progress plus a window of its results, or None if it
+        is unknown or expired"""
+        job = self.store.get(job_id, offset, limit)
+        if job is None:
+            return None
+        if job['state'] == 'running' and self._owner_gone(job):
+            logger.warning("Batch job %s lost its worker (pid %s)", job_id, job['ownerPid'])
+            self.store.abandon(job_id, _ABANDONED)
+            job = self.store.get(job_id, offset, limit)
+        return {
+            'jobId': job['jobId'],
+            'state': job['state'],
+            'total': job['total'],
+            'completed': job['completed'],
+            'failed': job['failed'],
+            'uniquePrompts': job['uniquePrompts'],
+            'offset': offset,
+            'results': job['results']
+        }
+
+    # ------------------------------------------------------------------
+    def _expand(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        documents = []
+        evaluated: Dict[str, Dict[str, Any]] = {}
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise BatchGenerationError(f"Item {position} must be an object")
+
+            if 'fields' in item:
+                if not isinstance(item['fields'], dict):
+                    raise BatchGenerationError(f"Item {position}: fields must be an object")
+                documents.append({'item': position, 'status': 'pending', 'fields': item['fields']})
+                continue
+
+            graph_id = item.get('graphId')
+            if not isinstance(graph_id, str) or not graph_id:
+                raise BatchGenerationError(f"Item {position} needs fields or graphId")
+
+            try:
+                if graph_id not in evaluated:
+                    # Never fall back to the default graph: that would spend
+                    # generations on a graph that does not exist
+                    if graph_store.latest_version(graph_id) is None:
+                        documents.append({'item': position, 'graphId': graph_id,
+                                          'status': 'error', 'error': f"Unknown graph {graph_id}"})
+                        continue
+                    evaluated[graph_id] = NodeGraphDataService.evaluate_node_graph(graph_id)
+            except (NodeGraphDataServiceError, sqlite3.Error) as exc:
+                documents.append({'item': position, 'graphId': graph_id,
+                                  'status': 'error', 'error': str(exc)})
+                continue
+
+            resolved = evaluated[graph_id]
+            if 'nodeId' in item:
+                node_ids = [item['nodeId']]
+            else:
+                node_ids = list(resolved['fields'])
+            for node_id in node_ids:
+                document = {'item': position, 'graphId': graph_id, 'graphVersion': resolved['version'],
+                            'nodeId': node_id}
+                if node_id in resolved['fields']:
+                    document.update(status='pending', fields=resolved['fields'][node_id])
+                else:
+                    document.update(status='error', error=f"Graph {graph_id} has no DocBuilder node {node_id}")
+                documents.append(document)
+        return documents
+
+    def _on_done(self, job_id: str, group: List[tuple], future: Future) -> None:
+        exc = future.exception()
+        results = []
+        for index, document in group:
+            result = {k: v for k, v in document.items() if k != 'fields'}
+            if exc is not None:
+                result.update(status='error', error=str(exc))
+            else:
+                template = future.result()
+                try:
+                    result.update(status='done', template=template,
+                                  html=render_template(template, document['fields']))
+                except Exception as render_exc:
+                    result.update(status='error', error=f"Failed to render template: {render_exc}")
+            results.append((index, result))
+
+        try:
+            job = self.store.finish_documents(job_id, results)
+        except sqlite3.Error as store_exc:
+            logger.error("Error storing results of batch job %s: %s", job_id, store_exc)
+            return
+        if job is not None and job['state'] == 'finished':
+            logger.info("Finished batch job %s (%s documents, %s failed)",
+                        job_id, job['total'], job['failed'])
+
+    def _owner_gone(self, job: Dict[str, Any]) -> bool:
+        """Whether the worker that runs ``job`` has exited"""
+        if job['ownerPid'] == os.getpid():
+            # Same pid but another token: this process reused a dead worker's pid
+            return job['ownerToken'] != self._token
+        try:
+            os.kill(job['ownerPid'], 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def _evict_expired(self) -> None:
+        for job in self.store.unfinished():
+            if self._owner_gone(job):
+                self.store.abandon(job['jobId'], _ABANDONED)
+        self.store.evict_finished_before(time.time() - self.job_ttl)
+
+    def _get_executor(self) -> tuple:
+        # Worker threads do not survive a fork; each process builds its own pool
+        pid = os.getpid()
+        with self._lock:
+            if self._pid != pid:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='batch-generation')
+                self._token = uuid.uuid4().hex
+                self._pid = pid
+            return self._executor, self._token
+
+
+batch_generation = BatchGenerationService(
+    BatchJobStore(settings.BATCH_DB_PATH),
+    max_workers=settings.BATCH_MAX_WORKERS,
+    max_items=settings.BATCH_MAX_ITEMS,
+    job_ttl=settings.BATCH_JOB_TTL_SECONDS
+)
@@ -0,0 +1,196 @@
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+-- One row per batch job. owner_pid/owner_token identify the worker process
+-- that runs the job's generations; finished stays NULL until every document
+-- has an outcome.
+CREATE TABLE IF NOT EXISTS batch_jobs (
+    job_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    finished REAL,
+    owner_pid INTEGER NOT NULL,
+    owner_token TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    unique_prompts INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS batch_jobs_finished ON batch_jobs (finished);
+
+CREATE TABLE IF NOT EXISTS batch_results (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (job_id, position)
+) WITHOUT ROWID;
+"""
+
+
+class BatchJobStore:
+    """SQLite-backed progress and results of batch generation jobs.
+
+    Any worker process can read a job; only the worker that owns it writes
+    its results. Like the graph store, the database runs in WAL mode and each
+    thread (and each forked process) gets its own connection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def create(self, job_id: str, documents: List[Dict[str, Any]], unique_prompts: int,
+               owner_pid: int, owner_token: str) -> None:
+        """Store a new job whose results start as ``documents`` (without their fields)"""
+        now = time.time()
+        completed = sum(1 for d in documents if d['status'] != 'pending')
+        failed = sum(1 for d in documents if d['status'] == 'error')
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'INSERT INTO batch_jobs (job_id, created, finished, owner_pid, owner_token, '
+                'total, completed, failed, unique_prompts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, now, now if completed == len(documents) else None, owner_pid,
+                 owner_token, len(documents), completed, failed, unique_prompts))
+            conn.executemany(
+                'INSERT INTO batch_results (job_id, position, status, payload) VALUES (?, ?, ?, ?)',
+                [(job_id, position, d['status'], _dumps(d)) for position, d in enumerate(documents)])
+
+    def finish_documents(self, job_id: str, results: List[Tuple[int, Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Record final ``(position, result)`` pairs and return the job's progress.
+
+        Results for documents that already have an outcome are ignored, so a
+        job that was abandoned meanwhile keeps its counters consistent.
+        Returns None if the job no longer exists."""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            completed = failed = 0
+            for position, result in results:
+                updated = conn.execute(
+                    'UPDATE batch_results SET status = ?, payload = ? '
+                    "WHERE job_id = ? AND position = ? AND status = 'pending'",
+                    (result['status'], _dumps(result), job_id, position)).rowcount
+                if updated:
+                    completed += 1
+                    failed += result['status'] == 'error'
+            return self._add_progress(conn, job_id, completed, failed)
+
+    def abandon(self, job_id: str, error: str) -> Optional[Dict[str, Any]]:
+        """Fail every pending document of a job whose owner is gone"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                "SELECT position, payload FROM batch_results WHERE job_id = ? AND status = 'pending'",
+                (job_id,)).fetchall()
+            for position, payload in rows:
+                result = json.loads(payload)
+                result.update(status='error', error=error)
+                conn.execute(
+                    'UPDATE batch_results SET status = ?, payload = ? WHERE job_id = ? AND position = ?',
+                    ('error', _dumps(result), job_id, position))
+            return self._add_progress(conn, job_id, len(rows), len(rows))
+
+    def get(self, job_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Return a job's progress plus a window of its results, or None if it is unknown"""
+        conn = self._connect()
+        # One read transaction so the counters match the results window
+        with conn:
+            conn.execute('BEGIN')
+            job = self._job(conn, job_id)
+            if job is None:
+                return None
+            rows = conn.execute(
+                'SELECT payload FROM batch_results WHERE job_id = ? AND position >= ? '
+                'ORDER BY position LIMIT ?',
+                (job_id, offset, -1 if limit is None else limit)).fetchall()
+        job['results'] = [json.loads(payload) for payload, in rows]
+        return job
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Return the progress of every job that is still running"""
+        conn = self._connect()
+        rows = conn.execute(
+            'SELECT job_id FROM batch_jobs WHERE finished IS NULL').fetchall()
+        jobs = [self._job(conn, job_id) for job_id, in rows]
+        return [job for job in jobs if job is not None]
+
+    def evict_finished_before(self, cutoff: float) -> int:
+        """Delete jobs that finished before ``cutoff`` and return how many were deleted"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            expired = [job_id for job_id, in conn.execute(
+                'SELECT job_id FROM batch_jobs WHERE finished < ?', (cutoff,))]
+            for job_id in expired:
+                conn.execute('DELETE FROM batch_results WHERE job_id = ?', (job_id,))
+                conn.execute('DELETE FROM batch_jobs WHERE job_id = ?', (job_id,))
+        return len(expired)
+
+    def close(self) -> None:
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ------------------------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid or self._local.conn is None:
+            # isolation_level=None: transactions are managed explicitly via BEGIN
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = pid
+        return self._local.conn
+
+    def _add_progress(self, conn, job_id, completed, failed) -> Optional[Dict[str, Any]]:
+        conn.execute(
+            'UPDATE batch_jobs SET completed = completed + ?, failed = failed + ? WHERE job_id = ?',
+            (completed, failed, job_id))
+        conn.execute(
+            'UPDATE batch_jobs SET finished = ? '
+            'WHERE job_id = ? AND finished IS NULL AND completed = total',
+            (time.time(), job_id))
+        return self._job(conn, job_id)
+
+    @staticmethod
+    def _job(conn, job_id) -> Optional[Dict[str, Any]]:
+        row = conn.execute(
+            'SELECT created, finished, owner_pid, owner_token, total, completed, failed, '
+            'unique_prompts FROM batch_jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        created, finished, owner_pid, owner_token, total, completed, failed, unique_prompts = row
+        return {
+            'jobId': job_id,
+            'state': 'finished' if finished is not None else 'running',
+            'createdAt': created,
+            'finishedAt': finished,
+            'ownerPid': owner_pid,
+            'ownerToken': owner_token,
+            'total': total,
+            'completed': completed,
+            'failed': failed,
+            'uniquePrompts': unique_prompts,
+        }
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
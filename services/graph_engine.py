@@ -0,0 +1,306 @@
+from collections import defaultdict, deque
+from typing import Dict, Any, Iterable, List, Optional, Set
+from services.graph_store import apply_ops
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class GraphCycleError(ValueError):
+    """Raised when the connections of a graph form a cycle"""
+    pass
+
+
+def _node_key(node_id: Any) -> str:
+    return str(node_id)
+
+
+class GraphEngine:
+    """In-memory graph model with hash indexes and incremental evaluation.
+
+    Indexes kept up to date on every change:
+        port -> owning node, port -> connections, target port -> source ports,
+        node -> downstream nodes and node -> upstream nodes (with edge counts).
+
+    Each node has a value: data nodes (e.g. DNI) evaluate to their ``data``;
+    DocBuilder nodes evaluate to the fields resolved from their inputs, in the
+    same shape the frontend sends to /api/generate-template. Changing a node
+    only marks it and its downstream nodes dirty, and ``evaluate`` recomputes
+    just those, in topological order.
+
+    The engine implements the state interface used by
+    ``services.graph_store.apply_ops`` so saved patches can be replayed on it.
+    It takes ownership of the node dicts of the graph it is built from.
+    """
+
+    def __init__(self, graph: Dict[str, Any], version: int = 0):
+        self.version = version
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.connections: Dict[str, Dict[str, Any]] = {}
+        self.port_owner: Dict[str, str] = {}
+        self.connections_by_port: Dict[str, Set[str]] = defaultdict(set)
+        self.sources_by_target: Dict[str, List[str]] = defaultdict(list)
+        self.downstream: Dict[str, Dict[str, int]] = {}
+        self.upstream: Dict[str, Dict[str, int]] = {}
+        self.values: Dict[str, Any] = {}
+        self.dirty: Set[str] = set()
+        self.last_recomputed = 0
+        self._order: Optional[List[str]] = None
+        self._check_cycles = False
+
+        for node in graph.get('nodes', []):
+            self.put_node(_node_key(node['id']), node, new=True)
+        for connection in graph.get('connections', []):
+            key = str(connection.get('id') or f"{connection['source']}-{connection['target']}")
+            self.add_connection(key, dict(connection))
+        # One topological sort checks the whole loaded graph instead of a
+        # reachability search per connection
+        self.topological_order()
+        self._check_cycles = True
+
+    # ------------------------------------------------------------------
+    # State interface used by apply_ops
+    # ------------------------------------------------------------------
+    def get_node(self, key: str) -> Optional[Dict[str, Any]]:
+        # Ops only shallow-merge changes, so a shallow copy keeps the stored node intact
+        node = self.nodes.get(key)
+        return dict(node) if node is not None else None
+
+    def put_node(self, key: str, node: Dict[str, Any], new: bool) -> None:
+        old = self.nodes.get(key)
+        old_ports = self._ports(old) if old is not None else []
+        ports = self._ports(node)
+        # Connections may name ports before their node exists, and an update
+        # may add or drop ports, so the edges of every connection on the old
+        # and new ports are resolved again
+        touching = set()
+        for port in old_ports + ports:
+            touching.update(self.connections_by_port.get(port, ()))
+        for connection_key in touching:
+            self._unlink_connection(self.connections[connection_key])
+
+        for port in old_ports:
+            self.port_owner.pop(port, None)
+        self.nodes[key] = node
+        for port in ports:
+            self.port_owner[port] = key
+
+        for connection_key in touching:
+            self._link_connection(self.connections[connection_key])
+        if new or touching:
+            self._order = None
+        self._mark_dirty(key)
+        if touching and self._check_cycles:
+            self.topological_order()
+
+    def delete_node(self, key: str) -> None:
+        # Drop connections first, while the port index can still resolve their nodes
+        self.delete_connections_touching(self._ports(self.nodes[key]))
+        node = self.nodes.pop(key)
+        for port in self._ports(node):
+            self.port_owner.pop(port, None)
+        self.values.pop(key, None)
+        self.dirty.discard(key)
+        self._order = None
+
+    def has_connection(self, key: str) -> bool:
+        return key in self.connections
+
+    def add_connection(self, key: str, connection: Dict[str, Any]) -> None:
+        source_node = self.port_owner.get(connection['source'])
+        target_node = self.port_owner.get(connection['target'])
+        if self._check_cycles and source_node is not None and target_node is not None \
+                and self._reaches(target_node, source_node):
+            raise GraphCycleError(f"Connection {key} would create a cycle")
+
+        self.connections[key] = connection
+        self.connections_by_port[connection['source']].add(key)
+        self.connections_by_port[connection['target']].add(key)
+        self.sources_by_target[connection['target']].append(connection['source'])
+        self._link_connection(connection)
+
+    def remove_connection(self, key: str) -> None:
+        connection = self.connections.pop(key)
+        for port in (connection['source'], connection['target']):
+            keys = self.connections_by_port[port]
+            keys.discard(key)
+            if not keys:
+                del self.connections_by_port[port]
+        sources = self.sources_by_target[connection['target']]
+        sources.remove(connection['source'])
+        if not sources:
+            del self.sources_by_target[connection['target']]
+        self._unlink_connection(connection)
+
+    def delete_connections_touching(self, ports: Iterable[str]) -> None:
+        touching = set()
+        for port in ports:
+            touching.update(self.connections_by_port.get(port, ()))
+        for key in touching:
+            self.remove_connection(key)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def apply_ops(self, ops: List[Dict[str, Any]], version: int) -> None:
+        """Apply saved patch ops (see ``services.graph_store.apply_ops``)"""
+        apply_ops(self, ops)
+        self.version = version
+
+    def update_node_data(self, node_id: Any, data: Dict[str, Any]) -> None:
+        """Replace a node's ``data``; only downstream nodes will be re-evaluated"""
+        key = _node_key(node_id)
+        self.nodes[key]['data'] = data
+        self._mark_dirty(key)
+
+    def topological_order(self) -> List[str]:
+        """Return node keys so that every node comes after its upstream nodes.
+
+        Raises:
+            GraphCycleError: If the graph contains a cycle
+        """
+        if self._order is not None:
+            return self._order
+
+        in_degree = {key: len(self.upstream.get(key, ())) for key in self.nodes}
+        queue = deque(key for key, degree in in_degree.items() if degree == 0)
+        order = []
+        while queue:
+            key = queue.popleft()
+            order.append(key)
+            for child in self.downstream.get(key, ()):
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    queue.append(child)
+
+        if len(order) != len(self.nodes):
+            raise GraphCycleError("Graph contains a cycle")
+        self._order = order
+        return order
+
+    def evaluate(self) -> Dict[str, Any]:
+        """Recompute dirty nodes in topological order and return all node values"""
+        if self.dirty:
+            order = self.topological_order()
+            # Walking the full order is cheaper than sorting a large dirty set
+            if len(self.dirty) * 4 >= len(order):
+                pending = [key for key in order if key in self.dirty]
+            else:
+                pending = self._sort_dirty()
+            for key in pending:
+                self.values[key] = self._evaluate_node(self.nodes[key])
+            self.last_recomputed = len(pending)
+            self.dirty.clear()
+        else:
+            self.last_recomputed = 0
+        return self.values
+
+    def resolved_fields(self) -> Dict[str, Dict[str, List[Any]]]:
+        """Return the resolved input fields of every DocBuilder node, keyed by node id"""
+        values = self.evaluate()
+        return {
+            self.nodes[key]['id']: values[key]
+            for key in self.nodes if self.nodes[key].get('type') == 'DocBuilder'
+        }
+
+    # ------------------------------------------------------------------
+    def _evaluate_node(self, node: Dict[str, Any]) -> Any:
+        if node.get('type') == 'DocBuilder':
+            # {'vendedor': [...], 'comprador': [...]}, like getInputFields in the frontend
+            fields = {}
+            for port in node.get('inputs') or []:
+                values = []
+                for source in self.sources_by_target.get(port['id'], ()):
+                    owner = self.port_owner.get(source)
+                    value = self.values.get(owner) if owner is not None else None
+                    if value:
+                        values.append(value)
+                fields[port['name'].lower()] = values
+            return fields
+        return node.get('data')
+
+    def _mark_dirty(self, key: str) -> None:
+        """Mark a node and everything downstream of it for re-evaluation"""
+        stack = [key]
+        while stack:
+            current = stack.pop()
+            if current in self.dirty:
+                continue
+            self.dirty.add(current)
+            stack.extend(self.downstream.get(current, ()))
+
+    def _reaches(self, start: str, goal: str) -> bool:
+        if start == goal:
+            return True
+        seen = {start}
+        stack = [start]
+        while stack:
+            for child in self.downstream.get(stack.pop(), ()):
+                if child == goal:
+                    return True
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return False
+
+    def _sort_dirty(self) -> List[str]:
+        """Order a small dirty set topologically without walking the whole graph.
+
+        The dirty set is closed under "downstream of", so a post-order DFS over
+        dirty upstream nodes yields a valid evaluation order."""
+        ordered, visited = [], set()
+        for root in self.dirty:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(self.upstream.get(root, ())))]
+            while stack:
+                key, parents = stack[-1]
+                for parent in parents:
+                    if parent in self.dirty and parent not in visited:
+                        visited.add(parent)
+                        stack.append((parent, iter(self.upstream.get(parent, ()))))
+                        break
+                else:
+                    stack.pop()
+                    ordered.append(key)
+        return ordered
+
+    def _link_connection(self, connection: Dict[str, Any]) -> None:
+        """Add the node edge of a connection whose ports both have an owner"""
+        source_node = self.port_owner.get(connection['source'])
+        target_node = self.port_owner.get(connection['target'])
+        if source_node is not None and target_node is not None:
+            self._link(self.downstream, source_node, target_node)
+            self._link(self.upstream, target_node, source_node)
+            self._order = None
+        if target_node is not None:
+            self._mark_dirty(target_node)
+
+    def _unlink_connection(self, connection: Dict[str, Any]) -> None:
+        source_node = self.port_owner.get(connection['source'])
+        target_node = self.port_owner.get(connection['target'])
+        if source_node is not None and target_node is not None:
+            self._unlink(self.downstream, source_node, target_node)
+            self._unlink(self.upstream, target_node, source_node)
+            self._order = None
+        if target_node is not None:
+            self._mark_dirty(target_node)
+
+    @staticmethod
+    def _link(index, a, b) -> None:
+        edges = index.setdefault(a, {})
+        edges[b] = edges.get(b, 0) + 1
+
+    @staticmethod
+    def _unlink(index, a, b) -> None:
+        edges = index[a]
+        edges[b] -= 1
+        if edges[b] <= 0:
+            del edges[b]
+        if not edges:
+            del index[a]
+
+    @staticmethod
+    def _ports(node: Dict[str, Any]) -> List[str]:
+        return [port['id'] for port in (node.get('inputs') or []) + (node.get('outputs') or [])]
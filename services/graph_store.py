@@ -0,0 +1,596 @@
+from typing import Dict, Any, Iterable, List, Optional
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS node_blobs (
+    hash TEXT PRIMARY KEY,
+    payload TEXT NOT NULL
+) WITHOUT ROWID;
+
+-- One row per saved version. Full saves and periodic compactions carry a
+-- snapshot (node_hashes + connections); patch saves carry the applied ops.
+CREATE TABLE IF NOT EXISTS graph_versions (
+    graph_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    created REAL NOT NULL,
+    node_count INTEGER NOT NULL,
+    connection_count INTEGER NOT NULL,
+    node_hashes TEXT,
+    connections TEXT,
+    ops TEXT,
+    PRIMARY KEY (graph_id, version)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS graphs (
+    graph_id TEXT PRIMARY KEY,
+    latest_version INTEGER NOT NULL,
+    snapshot_version INTEGER NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+
+-- Materialized latest state of each graph, so patches touch single rows
+CREATE TABLE IF NOT EXISTS head_nodes (
+    graph_id TEXT NOT NULL,
+    node_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (graph_id, node_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS head_nodes_order ON head_nodes (graph_id, seq);
+
+CREATE TABLE IF NOT EXISTS head_connections (
+    graph_id TEXT NOT NULL,
+    connection_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (graph_id, connection_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS head_connections_order ON head_connections (graph_id, seq);
+CREATE INDEX IF NOT EXISTS head_connections_source ON head_connections (graph_id, source);
+CREATE INDEX IF NOT EXISTS head_connections_target ON head_connections (graph_id, target);
+"""
+
+
+class VersionConflictError(Exception):
+    """Raised when a patch's base version is not the graph's latest version"""
+
+    def __init__(self, base_version: int, latest_version: int):
+        super().__init__(f"Base version {base_version} is stale; latest is {latest_version}")
+        self.base_version = base_version
+        self.latest_version = latest_version
+
+
+class InvalidPatchError(ValueError):
+    """Raised when a patch operation is malformed or targets a missing node/connection"""
+    pass
+
+
+def _dumps(value: Any) -> str:
+    """Canonical JSON so equal payloads always hash the same"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def content_hash(payload: str) -> str:
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _node_key(node_id: Any) -> str:
+    return str(node_id)
+
+
+def _connection_key(connection: Dict[str, Any]) -> str:
+    return str(connection.get('id') or f"{connection['source']}-{connection['target']}")
+
+
+def _node_ports(node: Dict[str, Any]) -> List[str]:
+    return [port['id'] for port in (node.get('inputs') or []) + (node.get('outputs') or [])]
+
+
+def _is_id(value: Any) -> bool:
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+
+def validate_node(node: Any) -> None:
+    """Check the fields the store and the graph engine rely on.
+
+    Raises:
+        InvalidPatchError: If the node is not an object with a string or integer
+            ``id`` whose ``inputs``/``outputs`` are lists of ports with ids
+    """
+    if not isinstance(node, dict):
+        raise InvalidPatchError("Node must be an object")
+    if not _is_id(node.get('id')):
+        raise InvalidPatchError("Node needs a string or integer id")
+    for side in ('inputs', 'outputs'):
+        ports = node.get(side)
+        if ports is None:
+            continue
+        if not isinstance(ports, list):
+            raise InvalidPatchError(f"Node {node['id']}: {side} must be a list")
+        for port in ports:
+            if not isinstance(port, dict) or not _is_id(port.get('id')):
+                raise InvalidPatchError(f"Node {node['id']}: every port needs an id")
+            if not isinstance(port.get('name', ''), str):
+                raise InvalidPatchError(f"Node {node['id']}: port names must be strings")
+    if node.get('type') == 'DocBuilder' and any('name' not in port for port in node.get('inputs') or []):
+        raise InvalidPatchError(f"Node {node['id']}: DocBuilder inputs need a name")
+
+
+def validate_connection(connection: Any) -> None:
+    """Raises InvalidPatchError unless ``connection`` has a source and a target port id"""
+    if not isinstance(connection, dict):
+        raise InvalidPatchError("Connection must be an object")
+    if not _is_id(connection.get('source')) or not _is_id(connection.get('target')):
+        raise InvalidPatchError("Connection needs a source and a target port id")
+    if connection.get('id') is not None and not _is_id(connection['id']):
+        raise InvalidPatchError("Connection id must be a string or integer")
+
+
+# ---------------------------------------------------------------------------
+# Patch application. Ops are applied against a small state interface that is
+# implemented both by the SQL head tables (for saves) and by plain dicts (for
+# rebuilding historical versions), so both paths share the same semantics.
+# ---------------------------------------------------------------------------
+def apply_ops(state, ops: Iterable[Dict[str, Any]]) -> None:
+    """Apply patch operations to ``state``.
+
+    Supported ops:
+        {"op": "addNode", "node": {...}}
+        {"op": "moveNode", "id": ..., "x": ..., "y": ...}
+        {"op": "updateNode", "id": ..., "changes": {...}}   (shallow merge)
+        {"op": "deleteNode", "id": ...}                     (also drops its connections)
+        {"op": "addConnection", "connection": {"source": ..., "target": ...}}
+        {"op": "removeConnection", "id": ...}
+
+    Raises:
+        InvalidPatchError: If an op is malformed or refers to a missing node/connection
+    """
+    for index, op in enumerate(ops):
+        try:
+            kind = op['op']
+            if kind == 'addNode':
+                node = op['node']
+                validate_node(node)
+                if state.get_node(_node_key(node['id'])) is not None:
+                    raise InvalidPatchError(f"Node {node['id']} already exists")
+                state.put_node(_node_key(node['id']), node, new=True)
+            elif kind in ('moveNode', 'updateNode'):
+                key = _node_key(op['id'])
+                node = state.get_node(key)
+                if node is None:
+                    raise InvalidPatchError(f"Node {op['id']} does not exist")
+                changes = {'x': op['x'], 'y': op['y']} if kind == 'moveNode' else op['changes']
+                if 'id' in changes and _node_key(changes['id']) != key:
+                    raise InvalidPatchError("Node ids cannot be changed")
+                node.update(changes)
+                validate_node(node)
+                state.put_node(key, node, new=False)
+            elif kind == 'deleteNode':
+                key = _node_key(op['id'])
+                node = state.get_node(key)
+                if node is None:
+                    raise InvalidPatchError(f"Node {op['id']} does not exist")
+                state.delete_node(key)
+                state.delete_connections_touching(_node_ports(node))
+            elif kind == 'addConnection':
+                connection = op['connection']
+                validate_connection(connection)
+                key = _connection_key(connection)
+                if not state.has_connection(key):
+                    state.add_connection(key, {**connection, 'id': key})
+            elif kind == 'removeConnection':
+                key = str(op['id'])
+                if not state.has_connection(key):
+                    raise InvalidPatchError(f"Connection {op['id']} does not exist")
+                state.remove_connection(key)
+            else:
+                raise InvalidPatchError(f"Unknown op {kind!r}")
+        except (KeyError, TypeError, AttributeError, ValueError) as exc:
+            if isinstance(exc, InvalidPatchError):
+                raise InvalidPatchError(f"Op {index}: {exc}")
+            raise InvalidPatchError(f"Malformed op at index {index}: {exc!r}")
+
+
+class _MemoryState:
+    """Graph held in ordered dicts, used to replay patches on top of a snapshot"""
+
+    def __init__(self, nodes: List[Dict[str, Any]], connections: List[Dict[str, Any]]):
+        self.nodes = {_node_key(n['id']): n for n in nodes}
+        self.connections = {_connection_key(c): c for c in connections}
+
+    def get_node(self, key):
+        node = self.nodes.get(key)
+        return dict(node) if node is not None else None
+
+    def put_node(self, key, node, new):
+        self.nodes[key] = node
+
+    def delete_node(self, key):
+        del self.nodes[key]
+
+    def has_connection(self, key):
+        return key in self.connections
+
+    def add_connection(self, key, connection):
+        self.connections[key] = connection
+
+    def remove_connection(self, key):
+        del self.connections[key]
+
+    def delete_connections_touching(self, ports):
+        ports = set(ports)
+        for key in [k for k, c in self.connections.items()
+                    if c['source'] in ports or c['target'] in ports]:
+            del self.connections[key]
+
+
+class _HeadState:
+    """Graph held in the head tables; every operation touches only indexed rows"""
+
+    def __init__(self, conn: sqlite3.Connection, graph_id: str):
+        self.conn = conn
+        self.graph_id = graph_id
+        # Net change in node/connection counts, so totals never need a COUNT(*)
+        self.node_delta = 0
+        self.connection_delta = 0
+
+    def get_node(self, key):
+        row = self.conn.execute(
+            'SELECT b.payload FROM head_nodes h JOIN node_blobs b ON b.hash = h.hash '
+            'WHERE h.graph_id = ? AND h.node_id = ?', (self.graph_id, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_node(self, key, node, new):
+        payload = _dumps(node)
+        digest = content_hash(payload)
+        self.conn.execute('INSERT OR IGNORE INTO node_blobs (hash, payload) VALUES (?, ?)',
+                          (digest, payload))
+        if new:
+            self.conn.execute(
+                'INSERT INTO head_nodes (graph_id, node_id, seq, hash) VALUES (?, ?, ?, ?)',
+                (self.graph_id, key, self._next_seq('head_nodes'), digest))
+            self.node_delta += 1
+        else:
+            self.conn.execute('UPDATE head_nodes SET hash = ? WHERE graph_id = ? AND node_id = ?',
+                              (digest, self.graph_id, key))
+
+    def delete_node(self, key):
+        self.conn.execute('DELETE FROM head_nodes WHERE graph_id = ? AND node_id = ?',
+                          (self.graph_id, key))
+        self.node_delta -= 1
+
+    def has_connection(self, key):
+        return self.conn.execute(
+            'SELECT 1 FROM head_connections WHERE graph_id = ? AND connection_id = ?',
+            (self.graph_id, key)).fetchone() is not None
+
+    def add_connection(self, key, connection):
+        self.conn.execute(
+            'INSERT INTO head_connections (graph_id, connection_id, seq, source, target, payload) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (self.graph_id, key, self._next_seq('head_connections'),
+             connection['source'], connection['target'], _dumps(connection)))
+        self.connection_delta += 1
+
+    def remove_connection(self, key):
+        self.conn.execute('DELETE FROM head_connections WHERE graph_id = ? AND connection_id = ?',
+                          (self.graph_id, key))
+        self.connection_delta -= 1
+
+    def delete_connections_touching(self, ports):
+        for port in ports:
+            cursor = self.conn.execute(
+                'DELETE FROM head_connections WHERE graph_id = ? AND (source = ? OR target = ?)',
+                (self.graph_id, port, port))
+            self.connection_delta -= cursor.rowcount
+
+    def _next_seq(self, table):
+        # MAX(seq) is answered from the (graph_id, seq) index
+        row = self.conn.execute(f'SELECT MAX(seq) FROM {table} WHERE graph_id = ?',
+                                (self.graph_id,)).fetchone()
+        return (row[0] or 0) + 1
+
+
+class GraphStore:
+    """SQLite-backed, versioned store for node graphs.
+
+    The latest state of every graph is materialized in the ``head_nodes`` and
+    ``head_connections`` tables, so loading it is an indexed range scan and a
+    patch only touches the rows it edits. Each save appends a version: full
+    saves store a snapshot, patches store their ops, and every
+    ``snapshot_interval`` patches a snapshot is written too so older versions
+    can be rebuilt by replaying a bounded number of patches.
+
+    Node payloads are stored once per content hash, so versions that share
+    nodes share storage. The database runs in WAL mode so readers never block
+    the writer. Each thread (and each forked process) gets its own connection.
+    """
+
+    def __init__(self, path: str, snapshot_interval: int = 50):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self._local = threading.local()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def save(self, graph_id: str, graph: Dict[str, Any]) -> int:
+        """Store ``graph`` as the next version of ``graph_id`` and return its version.
+
+        If the graph is identical to the latest version, no new version is
+        written and the latest version number is returned.
+
+        Raises:
+            InvalidPatchError: If the graph is malformed or two nodes share an id
+        """
+        if not isinstance(graph, dict):
+            raise InvalidPatchError("Graph must be an object")
+        nodes = graph.get('nodes', [])
+        connections = graph.get('connections', [])
+        if not isinstance(nodes, list) or not isinstance(connections, list):
+            raise InvalidPatchError("nodes and connections must be lists")
+        for index, node in enumerate(nodes):
+            try:
+                validate_node(node)
+            except InvalidPatchError as exc:
+                raise InvalidPatchError(f"nodes[{index}]: {exc}")
+        unique_connections: Dict[str, Dict[str, Any]] = {}
+        for index, connection in enumerate(connections):
+            try:
+                validate_connection(connection)
+            except InvalidPatchError as exc:
+                raise InvalidPatchError(f"connections[{index}]: {exc}")
+            # The head table holds one row per key: repeated identical
+            # connections collapse into one, conflicting ones are rejected
+            key = _connection_key(connection)
+            previous = unique_connections.setdefault(key, connection)
+            if previous is not connection and _dumps(previous) != _dumps(connection):
+                raise InvalidPatchError(f"connections[{index}]: duplicate connection id {key}")
+        connections = list(unique_connections.values())
+        node_payloads = [_dumps(node) for node in nodes]
+        node_hashes = [content_hash(p) for p in node_payloads]
+        node_keys = [_node_key(node['id']) for node in nodes]
+        if len(set(node_keys)) != len(node_keys):
+            raise InvalidPatchError("Node ids must be unique")
+        connection_rows = [
+            (graph_id, _connection_key(c), seq, c['source'], c['target'], _dumps(c))
+            for seq, c in enumerate(connections, 1)
+        ]
+
+        conn = self._connect()
+        with conn:
+            # Take the write lock up front so concurrent saves get distinct versions
+            conn.execute('BEGIN IMMEDIATE')
+            latest = self.latest_version(graph_id)
+            if latest is not None and self._head_matches(conn, graph_id, node_hashes, connection_rows):
+                return latest
+
+            conn.executemany(
+                'INSERT OR IGNORE INTO node_blobs (hash, payload) VALUES (?, ?)',
+                zip(node_hashes, node_payloads))
+            conn.execute('DELETE FROM head_nodes WHERE graph_id = ?', (graph_id,))
+            conn.executemany(
+                'INSERT INTO head_nodes (graph_id, node_id, seq, hash) VALUES (?, ?, ?, ?)',
+                [(graph_id, key, seq, digest)
+                 for seq, (key, digest) in enumerate(zip(node_keys, node_hashes), 1)])
+            conn.execute('DELETE FROM head_connections WHERE graph_id = ?', (graph_id,))
+            conn.executemany(
+                'INSERT INTO head_connections '
+                '(graph_id, connection_id, seq, source, target, payload) VALUES (?, ?, ?, ?, ?, ?)',
+                connection_rows)
+
+            version = (latest or 0) + 1
+            self._write_version(conn, graph_id, version, len(nodes), len(connections),
+                                snapshot=(_dumps(node_hashes), _dumps(connections)))
+        return version
+
+    def apply_patch(self, graph_id: str, base_version: int, ops: List[Dict[str, Any]]) -> int:
+        """Apply ``ops`` on top of ``base_version`` and return the new version.
+
+        Work done is proportional to the number of ops, not the graph size
+        (apart from a snapshot every ``snapshot_interval`` patches). An empty
+        op list returns ``base_version`` without writing anything. Graphs must
+        have been saved in full once before they can be patched.
+
+        Raises:
+            VersionConflictError: If ``base_version`` is not the latest version
+            InvalidPatchError: If an op is malformed or targets a missing node/connection,
+                or the graph was never saved
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT latest_version, snapshot_version FROM graphs WHERE graph_id = ?',
+                (graph_id,)).fetchone()
+            latest, snapshot_version = row if row else (0, 0)
+            if latest == 0:
+                raise InvalidPatchError("graph must be saved in full before it can be patched")
+            if base_version != latest:
+                raise VersionConflictError(base_version, latest)
+            if not ops:
+                return latest
+
+            node_count, connection_count = conn.execute(
+                'SELECT node_count, connection_count FROM graph_versions '
+                'WHERE graph_id = ? AND version = ?', (graph_id, latest)).fetchone()
+            state = _HeadState(conn, graph_id)
+            apply_ops(state, ops)
+            node_count += state.node_delta
+            connection_count += state.connection_delta
+
+            version = latest + 1
+            snapshot = None
+            if version - snapshot_version >= self.snapshot_interval:
+                snapshot = self._head_snapshot(conn, graph_id)
+            self._write_version(conn, graph_id, version, node_count, connection_count,
+                                snapshot=snapshot, ops=_dumps(ops))
+        return version
+
+    def load(self, graph_id: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Return ``{'nodes', 'connections', 'version'}`` for a version (latest by default),
+        or None if it does not exist."""
+        document = self.load_json(graph_id, version)
+        return json.loads(document) if document is not None else None
+
+    def load_json(self, graph_id: str, version: Optional[int] = None) -> Optional[str]:
+        """Same as ``load`` but returns the JSON document.
+
+        The latest version is assembled from the stored payloads without
+        decoding them; older versions are rebuilt from the nearest snapshot."""
+        conn = self._connect()
+        latest = self.latest_version(graph_id)
+        if latest is None or (version is not None and not 0 < version <= latest):
+            return None
+        if version is not None and version != latest:
+            return json.dumps(self._rebuild(conn, graph_id, version),
+                              ensure_ascii=False, separators=(',', ':'))
+
+        # One read transaction so the version and the rows always match
+        with conn:
+            conn.execute('BEGIN')
+            latest = self.latest_version(graph_id)
+            nodes = conn.execute(
+                'SELECT b.payload FROM head_nodes h JOIN node_blobs b ON b.hash = h.hash '
+                'WHERE h.graph_id = ? ORDER BY h.seq', (graph_id,)).fetchall()
+            connections = conn.execute(
+                'SELECT payload FROM head_connections WHERE graph_id = ? ORDER BY seq',
+                (graph_id,)).fetchall()
+        return ''.join([
+            '{"nodes":[', ','.join(p for (p,) in nodes),
+            '],"connections":[', ','.join(p for (p,) in connections),
+            '],"version":', str(latest), '}'
+        ])
+
+    def latest_version(self, graph_id: str) -> Optional[int]:
+        row = self._connect().execute(
+            'SELECT latest_version FROM graphs WHERE graph_id = ?', (graph_id,)).fetchone()
+        return row[0] if row else None
+
+    def graph_size(self, graph_id: str, version: Optional[int] = None) -> Optional[tuple]:
+        """Return ``(node_count, connection_count)`` of a version (latest by default), or None"""
+        return self._connect().execute(
+            'SELECT node_count, connection_count FROM graph_versions WHERE graph_id = ? AND '
+            'version = COALESCE(?, (SELECT latest_version FROM graphs WHERE graph_id = ?))',
+            (graph_id, version, graph_id)).fetchone()
+
+    def version_stamp(self, graph_id: str, version: Optional[int] = None) -> Optional[tuple]:
+        """Return ``(version, created)`` of a version (latest by default), or None.
+
+        Cheap to look up, and unique per saved version even across databases,
+        so it can stand in for the content when validating cached copies."""
+        return self._connect().execute(
+            'SELECT version, created FROM graph_versions WHERE graph_id = ? AND version = '
+            'COALESCE(?, (SELECT latest_version FROM graphs WHERE graph_id = ?))',
+            (graph_id, version, graph_id)).fetchone()
+
+    def ops_between(self, graph_id: str, from_version: int,
+                    to_version: int) -> Optional[List[tuple]]:
+        """Return ``[(version, ops), ...]`` for the versions after ``from_version`` up to
+        ``to_version``, or None if any of them was a full save (no ops to replay)."""
+        rows = self._connect().execute(
+            'SELECT version, ops FROM graph_versions WHERE graph_id = ? AND version > ? '
+            'AND version <= ? ORDER BY version', (graph_id, from_version, to_version)).fetchall()
+        if len(rows) != to_version - from_version or any(ops is None for _, ops in rows):
+            return None
+        return [(version, json.loads(ops)) for version, ops in rows]
+
+    def list_versions(self, graph_id: str) -> List[Dict[str, Any]]:
+        """Return the version history of a graph, newest first"""
+        rows = self._connect().execute(
+            'SELECT version, created, node_count, connection_count, ops IS NOT NULL '
+            'FROM graph_versions WHERE graph_id = ? ORDER BY version DESC', (graph_id,)).fetchall()
+        return [
+            {'version': v, 'created': c, 'nodes': n, 'connections': e,
+             'kind': 'patch' if is_patch else 'full'}
+            for v, c, n, e, is_patch in rows
+        ]
+
+    def close(self) -> None:
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ------------------------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid or self._local.conn is None:
+            # isolation_level=None: transactions are managed explicitly via BEGIN
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = pid
+        return self._local.conn
+
+    @staticmethod
+    def _head_matches(conn, graph_id, node_hashes, connection_rows) -> bool:
+        head_hashes = [h for (h,) in conn.execute(
+            'SELECT hash FROM head_nodes WHERE graph_id = ? ORDER BY seq', (graph_id,))]
+        if head_hashes != node_hashes:
+            return False
+        head_connections = [p for (p,) in conn.execute(
+            'SELECT payload FROM head_connections WHERE graph_id = ? ORDER BY seq', (graph_id,))]
+        return head_connections == [row[5] for row in connection_rows]
+
+    @staticmethod
+    def _head_snapshot(conn, graph_id) -> tuple:
+        node_hashes = [h for (h,) in conn.execute(
+            'SELECT hash FROM head_nodes WHERE graph_id = ? ORDER BY seq', (graph_id,))]
+        connections = ','.join(p for (p,) in conn.execute(
+            'SELECT payload FROM head_connections WHERE graph_id = ? ORDER BY seq', (graph_id,)))
+        return _dumps(node_hashes), f'[{connections}]'
+
+    @staticmethod
+    def _write_version(conn, graph_id, version, node_count, connection_count,
+                       snapshot=None, ops=None) -> None:
+        node_hashes, connections = snapshot if snapshot else (None, None)
+        now = time.time()
+        conn.execute(
+            'INSERT INTO graph_versions (graph_id, version, created, node_count, '
+            'connection_count, node_hashes, connections, ops) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (graph_id, version, now, node_count, connection_count, node_hashes, connections, ops))
+        conn.execute(
+            'INSERT INTO graphs (graph_id, latest_version, snapshot_version, updated) '
+            'VALUES (?, ?, ?, ?) ON CONFLICT(graph_id) DO UPDATE SET '
+            'latest_version = excluded.latest_version, updated = excluded.updated, '
+            'snapshot_version = CASE WHEN ? THEN excluded.snapshot_version ELSE snapshot_version END',
+            (graph_id, version, version, now, snapshot is not None))
+
+    @staticmethod
+    def _rebuild(conn, graph_id, version) -> Dict[str, Any]:
+        """Rebuild an older version from the nearest snapshot plus the patches after it"""
+        base_version, hashes_json, connections_json = conn.execute(
+            'SELECT version, node_hashes, connections FROM graph_versions '
+            'WHERE graph_id = ? AND version <= ? AND node_hashes IS NOT NULL '
+            'ORDER BY version DESC LIMIT 1', (graph_id, version)).fetchone()
+        payloads = conn.execute(
+            'SELECT b.payload FROM json_each(?) AS j '
+            'JOIN node_blobs AS b ON b.hash = j.value ORDER BY j.key',
+            (hashes_json,)).fetchall()
+        nodes = json.loads('[' + ','.join(p for (p,) in payloads) + ']')
+        state = _MemoryState(nodes, json.loads(connections_json))
+
+        for (ops_json,) in conn.execute(
+                'SELECT ops FROM graph_versions WHERE graph_id = ? AND version > ? '
+                'AND version <= ? ORDER BY version', (graph_id, base_version, version)):
+            apply_ops(state, json.loads(ops_json))
+
+        return {
+            'nodes': list(state.nodes.values()),
+            'connections': list(state.connections.values()),
+            'version': version
+        }
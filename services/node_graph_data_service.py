@@ -1,14 +1,53 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from config import settings
+from services.graph_store import GraphStore, InvalidPatchError, VersionConflictError, content_hash
+from services.graph_engine import GraphCycleError, GraphEngine
+from collections import OrderedDict
+from metrics import record_graph_size
+import json
 import logging
+import sqlite3
+import threading
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_GRAPH_ID = 'default'
+
+# Shared store; connections are opened per thread on first use
+graph_store = GraphStore(settings.GRAPH_DB_PATH)
+
+# Evaluation engines of recently evaluated graphs, kept warm so that new
+# versions only re-evaluate what their patches touched. Each cached graph has
+# a lock serializing its evaluations; it is dropped with the engine.
+_ENGINE_CACHE_SIZE = 16
+_engines: "OrderedDict[str, GraphEngine]" = OrderedDict()
+_engine_locks: Dict[str, threading.Lock] = {}
+_engines_lock = threading.Lock()
+
 
 class NodeGraphDataServiceError(Exception):
     """Custom exception for graph–data service errors"""
     pass
 
 
+class GraphVersionNotFoundError(NodeGraphDataServiceError):
+    """Raised when a specific graph version is requested but does not exist"""
+    pass
+
+
+class GraphVersionConflictError(NodeGraphDataServiceError):
+    """Raised when a patch is based on a version that is no longer the latest"""
+
+    def __init__(self, message: str, latest_version: int):
+        super().__init__(message)
+        self.latest_version = latest_version
+
+
+class InvalidGraphDataError(NodeGraphDataServiceError):
+    """Raised when submitted graph data or patch operations are invalid"""
+    pass
+
+
 class NodeGraphDataService:
     """Service for providing and persisting the node-graph data used by the frontend."""
 
@@ -55,16 +94,177 @@ class NodeGraphDataService:
         }
 
     @staticmethod
-    def save_node_graph(graph_data: Dict[str, Any]) -> None:
-        """Pretend-persist the supplied graph (nodes + connections).
+    def get_node_graph(graph_id: str = DEFAULT_GRAPH_ID,
+                       version: Optional[int] = None) -> Dict[str, Any]:
+        """Return a saved graph version (latest by default) with its ``version`` number.
 
-        In a real application this would talk to a database; for now we just log."""
+        A graph that has never been saved resolves to the default graph at version 0."""
         try:
+            graph = graph_store.load(graph_id, version)
+        except sqlite3.Error as exc:
+            logger.error("Error loading graph %s: %s", graph_id, exc)
+            raise NodeGraphDataServiceError(f"Failed to load graph: {exc}")
+
+        if graph is None:
+            if version is not None:
+                raise GraphVersionNotFoundError(
+                    f"Graph {graph_id} has no version {version}")
+            graph = NodeGraphDataService.get_default_node_graph()
+            graph['version'] = 0
+        return graph
+
+    @staticmethod
+    def get_node_graph_json(graph_id: str = DEFAULT_GRAPH_ID,
+                            version: Optional[int] = None) -> str:
+        """Same as get_node_graph but returns the serialized JSON document.
+
+        Saved graphs are assembled straight from the stored payloads, which
+        avoids decoding and re-encoding every node for large graphs."""
+        try:
+            document = graph_store.load_json(graph_id, version)
+        except sqlite3.Error as exc:
+            logger.error("Error loading graph %s: %s", graph_id, exc)
+            raise NodeGraphDataServiceError(f"Failed to load graph: {exc}")
+
+        if document is None:
+            return json.dumps(NodeGraphDataService.get_node_graph(graph_id, version))
+        return document
+
+    @staticmethod
+    def get_node_graph_etag(graph_id: str = DEFAULT_GRAPH_ID,
+                            version: Optional[int] = None) -> str:
+        """Return a strong entity tag for the document get_node_graph_json would return.
+
+        Computed without loading the graph: saved versions are tagged by their
+        version stamp and the default graph by a hash of its content."""
+        try:
+            stamp = graph_store.version_stamp(graph_id, version)
+        except sqlite3.Error as exc:
+            logger.error("Error loading graph %s: %s", graph_id, exc)
+            raise NodeGraphDataServiceError(f"Failed to load graph: {exc}")
+
+        if stamp is None:
+            if version is not None:
+                raise GraphVersionNotFoundError(
+                    f"Graph {graph_id} has no version {version}")
+            return content_hash(json.dumps(NodeGraphDataService.get_default_node_graph()))[:32]
+        return content_hash(f'{graph_id}\0{stamp[0]}\0{stamp[1]!r}')[:32]
+
+    @staticmethod
+    def save_node_graph(graph_data: Dict[str, Any], graph_id: str = DEFAULT_GRAPH_ID) -> int:
+        """Persist the supplied graph (nodes + connections) and return the stored version."""
+        try:
+            version = graph_store.save(graph_id, graph_data)
+            node_count, connection_count = graph_store.graph_size(graph_id, version)
+            record_graph_size('full', node_count, connection_count)
             logger.info(
-                "Saving %s nodes and %s connections",
-                len(graph_data.get('nodes', [])),
-                len(graph_data.get('connections', []))
+                "Saved graph %s version %s (%s nodes, %s connections)",
+                graph_id,
+                version,
+                node_count,
+                connection_count
             )
-        except Exception as exc:
+            return version
+        except InvalidPatchError as exc:
+            raise InvalidGraphDataError(str(exc))
+        except sqlite3.Error as exc:
             logger.error("Error saving graph: %s", exc)
-            raise GraphDataServiceError(f"Failed to save graph: {exc}")
+            raise NodeGraphDataServiceError(f"Failed to save graph: {exc}")
+
+    @staticmethod
+    def patch_node_graph(graph_id: str, base_version: int,
+                         ops: List[Dict[str, Any]]) -> int:
+        """Apply a batch of edit operations to the latest version and return the new version.
+
+        See ``services.graph_store.apply_ops`` for the supported operations."""
+        try:
+            version = graph_store.apply_patch(graph_id, base_version, ops)
+            if version != base_version:
+                record_graph_size('patch', *graph_store.graph_size(graph_id, version))
+            logger.info("Patched graph %s to version %s (%s ops)", graph_id, version, len(ops))
+            return version
+        except VersionConflictError as exc:
+            raise GraphVersionConflictError(str(exc), exc.latest_version)
+        except InvalidPatchError as exc:
+            raise InvalidGraphDataError(str(exc))
+        except sqlite3.Error as exc:
+            logger.error("Error patching graph %s: %s", graph_id, exc)
+            raise NodeGraphDataServiceError(f"Failed to patch graph: {exc}")
+
+    @staticmethod
+    def list_versions(graph_id: str = DEFAULT_GRAPH_ID) -> List[Dict[str, Any]]:
+        """Return the saved versions of a graph, newest first."""
+        try:
+            return graph_store.list_versions(graph_id)
+        except sqlite3.Error as exc:
+            logger.error("Error listing versions of graph %s: %s", graph_id, exc)
+            raise NodeGraphDataServiceError(f"Failed to list graph versions: {exc}")
+
+    @staticmethod
+    def evaluate_node_graph(graph_id: str = DEFAULT_GRAPH_ID) -> Dict[str, Any]:
+        """Resolve the input fields of every DocBuilder node in the latest version.
+
+        Returns ``{'version', 'fields', 'recomputed'}`` where ``fields`` maps
+        DocBuilder node ids to ``{'vendedor': [...], 'comprador': [...]}`` and
+        ``recomputed`` is the number of nodes that had to be re-evaluated.
+
+        Raises:
+            GraphVersionNotFoundError: If the graph was never saved"""
+        try:
+            saved = graph_store.latest_version(graph_id) is not None
+        except sqlite3.Error as exc:
+            logger.error("Error evaluating graph %s: %s", graph_id, exc)
+            raise NodeGraphDataServiceError(f"Failed to evaluate graph: {exc}")
+        if not saved:
+            raise GraphVersionNotFoundError(f"Graph {graph_id} has never been saved")
+
+        with _engines_lock:
+            lock = _engine_locks.setdefault(graph_id, threading.Lock())
+
+        with lock:
+            try:
+                engine = NodeGraphDataService._get_engine(graph_id)
+                fields = engine.resolved_fields()
+            except GraphCycleError as exc:
+                with _engines_lock:
+                    _engines.pop(graph_id, None)
+                    _engine_locks.pop(graph_id, None)
+                raise InvalidGraphDataError(str(exc))
+            except sqlite3.Error as exc:
+                logger.error("Error evaluating graph %s: %s", graph_id, exc)
+                raise NodeGraphDataServiceError(f"Failed to evaluate graph: {exc}")
+
+            return {
+                'version': engine.version,
+                'fields': fields,
+                'recomputed': engine.last_recomputed
+            }
+
+    @staticmethod
+    def _get_engine(graph_id: str) -> GraphEngine:
+        """Return an engine at the latest version, replaying patches onto a cached one if possible"""
+        latest = graph_store.latest_version(graph_id) or 0
+        with _engines_lock:
+            engine = _engines.get(graph_id)
+            if engine is not None:
+                _engines.move_to_end(graph_id)
+
+        if engine is not None and engine.version < latest:
+            patches = graph_store.ops_between(graph_id, engine.version, latest)
+            try:
+                for version, ops in patches or ():
+                    engine.apply_ops(ops, version)
+            except (InvalidPatchError, GraphCycleError):
+                patches = None
+            if patches is None:
+                engine = None
+
+        if engine is None or engine.version != latest:
+            graph = NodeGraphDataService.get_node_graph(graph_id)
+            engine = GraphEngine(graph, graph['version'])
+            with _engines_lock:
+                _engines[graph_id] = engine
+                while len(_engines) > _ENGINE_CACHE_SIZE:
+                    evicted, _ = _engines.popitem(last=False)
+                    _engine_locks.pop(evicted, None)
+        return engine
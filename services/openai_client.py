@@ -0,0 +1,203 @@
+from openai import (OpenAI, Timeout, APIConnectionError, APITimeoutError,
+                    InternalServerError, RateLimitError)
+from config import settings
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upstream errors that are worth retrying
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+
+class UpstreamBusyError(Exception):
+    """Raised when an upstream call cannot get a concurrency or rate-limit slot in time"""
+    pass
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take one token, sleeping until one is available or ``timeout`` elapses."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class UpstreamLimiter:
+    """Bounds concurrency and request rate of upstream calls and retries transient errors.
+
+    Retries of all calls draw from one shared budget (a token bucket refilled
+    at ``retry_rate`` per second up to ``retry_burst``). When an error storm
+    empties it, calls fail fast instead of multiplying upstream load by
+    ``max_retries``.
+    """
+
+    def __init__(self, max_concurrency: int, queue_timeout: float,
+                 rate: float = 0, burst: int = 1, max_retries: int = 0,
+                 base_delay: float = 0.5, max_delay: float = 8.0,
+                 retry_rate: float = 0, retry_burst: int = 1):
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self._retry_budget = TokenBucket(retry_rate, retry_burst) if retry_rate > 0 else None
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one concurrency slot (and spend one rate-limit token) for the block's duration.
+
+        The slot is taken first, so a caller that times out never spends a
+        token, and both waits share one ``queue_timeout`` deadline.
+
+        Raises:
+            UpstreamBusyError: If no slot or token frees up within ``queue_timeout``
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        if not self._semaphore.acquire(timeout=self.queue_timeout):
+            raise UpstreamBusyError("Too many concurrent upstream requests")
+        try:
+            if self._bucket is not None and not self._bucket.acquire(
+                    max(0.0, deadline - time.monotonic())):
+                raise UpstreamBusyError("Upstream rate limit exceeded")
+            yield
+        finally:
+            self._semaphore.release()
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call ``fn`` inside a concurrency slot, retrying retryable errors with jittered backoff.
+
+        A retry is only made if the shared retry budget has a token left;
+        otherwise the error is raised at once.
+
+        Raises:
+            UpstreamBusyError: If no slot or rate-limit token frees up within ``queue_timeout``
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.slot():
+                    return fn(*args, **kwargs)
+            except RETRYABLE_ERRORS as exc:
+                if attempt >= self.max_retries:
+                    raise
+                if self._retry_budget is not None and not self._retry_budget.acquire(timeout=0):
+                    logger.warning("Upstream call failed (%s), retry budget exhausted",
+                                   exc.__class__.__name__)
+                    raise
+                delay = self._backoff(attempt, exc)
+                logger.warning("Upstream call failed (%s), retry %s/%s in %.2fs",
+                               exc.__class__.__name__, attempt + 1, self.max_retries, delay)
+
+            # Sleep outside the slot so waiting callers can use it meanwhile
+            time.sleep(delay)
+            attempt += 1
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when the server sends one"""
+        response = getattr(exc, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+# ---------------------------------------------------------------------------
+# Process-wide instances. They are rebuilt lazily after a fork so that gunicorn
+# workers never share sockets or locks inherited from the master process.
+# ---------------------------------------------------------------------------
+_lock = threading.Lock()
+_pid: Optional[int] = None
+_client: Optional[OpenAI] = None
+_limiter: Optional[UpstreamLimiter] = None
+
+
+def _build_client() -> OpenAI:
+    return OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL or None,
+        timeout=Timeout(settings.OPENAI_READ_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+        # Retries are handled by UpstreamLimiter so they draw from its shared retry budget
+        max_retries=0,
+    )
+
+
+def _build_limiter() -> UpstreamLimiter:
+    return UpstreamLimiter(
+        max_concurrency=settings.OPENAI_MAX_CONCURRENCY,
+        queue_timeout=settings.OPENAI_QUEUE_TIMEOUT,
+        rate=settings.OPENAI_RATE_LIMIT_RPS,
+        burst=settings.OPENAI_RATE_LIMIT_BURST,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        base_delay=settings.OPENAI_RETRY_BASE_DELAY,
+        max_delay=settings.OPENAI_RETRY_MAX_DELAY,
+        retry_rate=settings.OPENAI_RETRY_BUDGET_RPS,
+        retry_burst=settings.OPENAI_RETRY_BUDGET_BURST,
+    )
+
+
+def _ensure_initialized() -> None:
+    global _pid, _client, _limiter
+    pid = os.getpid()
+    if _pid == pid:
+        return
+    with _lock:
+        if _pid != pid:
+            _client = _build_client()
+            _limiter = _build_limiter()
+            _pid = pid
+
+
+def get_client() -> OpenAI:
+    """Return this process's shared OpenAI client (keep-alive connection pool)"""
+    _ensure_initialized()
+    return _client
+
+
+def get_limiter() -> UpstreamLimiter:
+    """Return this process's shared upstream limiter"""
+    _ensure_initialized()
+    return _limiter
+
+
+def reset() -> None:
+    """Drop the shared instances; the next call rebuilds them from current settings"""
+    global _pid, _client, _limiter, _lock
+    _lock = threading.Lock()
+    _pid = _client = _limiter = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset)
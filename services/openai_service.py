@@ -1,6 +1,8 @@
-from openai import OpenAI
 from config import settings
-from typing import Dict, Any
+from services.openai_client import UpstreamBusyError, get_client, get_limiter
+from services.template_cache import template_cache
+from metrics import LLMCall
+from typing import Dict, Any, Iterator, List
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,8 +12,12 @@ class OpenAIServiceError(Exception):
     pass
 
 class OpenAIService:
+    SYSTEM_PROMPT = "You are a legal document assistant that generates contract templates. Always maintain the exact placeholder syntax provided."
+    TEMPERATURE = 0.7
+
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = get_client()
+        self.limiter = get_limiter()
         self.model = settings.OPENAI_MODEL
 
     def generate_contract_template(self, fields: Dict[str, Any]) -> str:
@@ -29,25 +35,112 @@ class OpenAIService:
         """
         try:
             prompt = self._build_prompt(fields)
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a legal document assistant that generates contract templates. Always maintain the exact placeholder syntax provided."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content
-            
+            key = self.cache_key(fields)
+
+            return template_cache.get_or_compute(key, lambda: self._complete(prompt))
+
+        except UpstreamBusyError:
+            # Load shedding, not a failure: the route answers 503 with Retry-After
+            raise
         except Exception as e:
             logger.error(f"Error generating contract template: {str(e)}")
             raise OpenAIServiceError(f"Failed to generate template: {str(e)}")
-    
+
+    def stream_contract_template(self, fields: Dict[str, Any]) -> Iterator[str]:
+        """
+        Generate a contract template, yielding text chunks as the model produces them
+
+        A cached template is yielded as a single chunk. Concurrent identical
+        requests share one upstream stream (see TemplateCache.stream), and a
+        fully streamed template is stored in the same cache used by
+        generate_contract_template. Closing the iterator early (e.g. on client
+        disconnect) closes the upstream stream unless other requests follow it.
+
+        Args:
+            fields: Dictionary containing contract fields
+
+        Yields:
+            str: Consecutive pieces of the generated template
+
+        Raises:
+            OpenAIServiceError: If there's an error generating the template
+        """
+        try:
+            prompt = self._build_prompt(fields)
+            key = self.cache_key(fields)
+
+            yield from template_cache.stream(key, lambda: self._stream_completion(prompt))
+
+        except GeneratorExit:
+            logger.info("Template stream cancelled by client")
+            raise
+        except UpstreamBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating contract template: {str(e)}")
+            raise OpenAIServiceError(f"Failed to generate template: {str(e)}")
+
+    def cache_key(self, fields: Dict[str, Any]) -> str:
+        """Return the template cache key; equal keys mean identical upstream requests"""
+        return template_cache.make_key(self._build_prompt(fields), self.model, self.TEMPERATURE)
+
+    def _stream_completion(self, prompt: str) -> Iterator[str]:
+        """Stream the completion text for the prompt from the model"""
+        parts: List[str] = []
+        usage = None
+        with LLMCall(self.model, 'stream') as call, self.limiter.slot():
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=self._messages(prompt),
+                temperature=self.TEMPERATURE,
+                stream=True,
+                # Token usage arrives in a final chunk without choices
+                stream_options={"include_usage": True}
+            )
+            try:
+                for chunk in stream:
+                    if getattr(chunk, 'usage', None) is not None:
+                        usage = chunk.usage
+                        call.record_usage(usage)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            finally:
+                stream.close()
+        self._log_completion(''.join(parts), usage, streamed=True)
+
+    def _complete(self, prompt: str) -> str:
+        """Send the prompt to the model and return the completion text"""
+        with LLMCall(self.model, 'complete') as call:
+            response = self.limiter.call(
+                self.client.chat.completions.create,
+                model=self.model,
+                messages=self._messages(prompt),
+                temperature=self.TEMPERATURE
+            )
+            call.record_usage(response.usage)
+
+        template = response.choices[0].message.content
+        self._log_completion(template, response.usage, streamed=False)
+        return template
+
+    def _log_completion(self, template: str, usage: Any, streamed: bool) -> None:
+        """Log a finished completion; the text and usage go in a (sampled) payload"""
+        logger.info(
+            "Generated contract template (%s chars%s)", len(template), ', streamed' if streamed else '',
+            extra={'payload': {
+                'template': template,
+                'usage': usage.model_dump() if usage is not None else None
+            }})
+
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        """Wrap the user prompt with the system instructions"""
+        return [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
     def _build_prompt(self, fields: Dict[str, Any]) -> str:
         """Build the prompt for contract generation"""
         return f"""
@@ -0,0 +1,80 @@
+"""Image work for uploaded DNI photos, run in the photo store's process pool.
+
+Kept free of application imports so pool processes stay small. Requires the
+optional Pillow package; ``PILLOW_AVAILABLE`` tells whether it is installed.
+"""
+from typing import Any, Dict
+import json
+import os
+
+try:
+    from PIL import Image, ImageOps
+    PILLOW_AVAILABLE = True
+except ImportError:  # optional dependency
+    Image = ImageOps = None
+    PILLOW_AVAILABLE = False
+
+
+def _replace_atomically(path: str, write) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def _to_rgb(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def process_photo(original: str, image_path: str, thumbnail_path: str, meta_path: str,
+                  max_dimension: int, thumbnail_size: int, quality: int) -> Dict[str, Any]:
+    """Decode ``original``, apply its EXIF orientation and write a downscaled
+    JPEG and a thumbnail, then the metadata file that marks the photo ready.
+
+    A photo that cannot be decoded gets an ``error`` metadata file instead, so
+    it is not retried. Every file is written under a temporary name and
+    renamed into place.
+    """
+    try:
+        with Image.open(original) as source:
+            source_format = source.format
+            source_size = source.size
+            # JPEG only: decode directly at a reduced scale (1/2, 1/4 or 1/8),
+            # which bounds memory by the output size rather than the photo's
+            source.draft('RGB', (max_dimension, max_dimension))
+            image = _to_rgb(ImageOps.exif_transpose(source))
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        _replace_atomically(image_path, lambda tmp: image.save(
+            tmp, 'JPEG', quality=quality, optimize=True))
+
+        thumbnail = image.copy()
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+        _replace_atomically(thumbnail_path, lambda tmp: thumbnail.save(
+            tmp, 'JPEG', quality=quality, optimize=True))
+
+        meta = {
+            'state': 'ready',
+            'format': source_format,
+            'sourceWidth': source_size[0],
+            'sourceHeight': source_size[1],
+            'width': image.width,
+            'height': image.height,
+        }
+    except (OSError, ValueError, SyntaxError, MemoryError, Image.DecompressionBombError) as exc:
+        meta = {'state': 'error', 'error': f"Could not process photo ({type(exc).__name__})"}
+
+    def write_meta(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    _replace_atomically(meta_path, write_meta)
+    return meta
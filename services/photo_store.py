@@ -0,0 +1,356 @@
+from config import settings
+from services.photo_processing import PILLOW_AVAILABLE, process_photo
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+_PHOTO_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Leading bytes of the accepted formats
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+)
+
+
+class PhotoStoreError(Exception):
+    """Raised when an upload is invalid"""
+    pass
+
+
+class PhotoTooLargeError(PhotoStoreError):
+    """Raised when an upload exceeds PHOTO_MAX_BYTES"""
+    pass
+
+
+class UnsupportedPhotoError(PhotoStoreError):
+    """Raised when an upload is not a JPEG, PNG or WebP image"""
+    pass
+
+
+class PhotoProcessingUnavailableError(PhotoStoreError):
+    """Raised when Pillow is not installed"""
+    pass
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _sniff(head: bytes) -> Optional[str]:
+    for signature, mimetype in _SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+class PhotoStore:
+    """Content-addressed storage and background processing of DNI photos.
+
+    An upload is streamed to a temporary file in fixed-size chunks while it is
+    hashed, then renamed to ``originals/<id>``, where the id is the SHA-256 of
+    its content; an id that already exists is not stored or processed again.
+    Decoding, orientation, downscaling and thumbnails run in a process pool,
+    which writes ``images/<id>.jpg``, ``thumbs/<id>.jpg`` and finally
+    ``meta/<id>.json``. State is read from those files, so any worker process
+    can answer for a photo.
+
+    Before submitting a photo, a worker creates ``meta/<id>.claim`` with
+    ``O_EXCL``, recording its pid and the time, so only one worker processes
+    a photo; the claim is removed once the photo is processed. A claim whose
+    worker has exited, that is older than ``claim_timeout`` seconds, or that
+    was released after a failure is stale: the next poll replaces it and
+    resubmits the photo. The claim counts attempts, and a photo that has
+    failed ``max_attempts`` times (e.g. by crashing the pool) gets an
+    ``error`` state instead of another attempt.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_workers: int,
+                 max_dimension: int, thumbnail_size: int, quality: int, claim_timeout: float,
+                 max_attempts: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.max_dimension = max_dimension
+        self.thumbnail_size = thumbnail_size
+        self.quality = quality
+        self.claim_timeout = claim_timeout
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+
+    def save(self, stream: BinaryIO) -> Tuple[str, bool]:
+        """Store an upload read from ``stream`` and start processing it.
+
+        Returns:
+            The photo id and whether the photo was new
+
+        Raises:
+            PhotoProcessingUnavailableError: If Pillow is not installed
+            PhotoTooLargeError: If the upload exceeds PHOTO_MAX_BYTES
+            UnsupportedPhotoError: If the upload is not a supported image
+        """
+        if not PILLOW_AVAILABLE:
+            raise PhotoProcessingUnavailableError(
+                "Photo processing requires the optional Pillow package")
+
+        tmp_dir = os.path.join(self.directory, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            digest = hashlib.sha256()
+            head = b''
+            size = 0
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise PhotoTooLargeError(
+                            f"Photo exceeds the {self.max_bytes} byte limit")
+                    if len(head) < 12:
+                        head += chunk[:12 - len(head)]
+                        if len(head) == 12 and _sniff(head) is None:
+                            raise UnsupportedPhotoError("Photo must be a JPEG, PNG or WebP image")
+                    digest.update(chunk)
+                    f.write(chunk)
+            if _sniff(head) is None:
+                raise UnsupportedPhotoError("Photo must be a JPEG, PNG or WebP image")
+
+            photo_id = digest.hexdigest()
+            original = self._path('originals', photo_id)
+            created = not os.path.exists(original)
+            if created:
+                os.makedirs(os.path.dirname(original), exist_ok=True)
+                os.replace(tmp_path, original)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        logger.info("Stored photo %s (%s bytes, %s)", photo_id, size, 'new' if created else 'duplicate')
+        self._ensure_processing(photo_id)
+        return photo_id, created
+
+    def status(self, photo_id: str) -> Optional[Dict[str, Any]]:
+        """Return the photo's state (``processing``, ``ready`` or ``error``) and,
+        once ready, its dimensions; None if the photo is unknown"""
+        if not _PHOTO_ID_PATTERN.match(photo_id):
+            return None
+        meta = self._read_meta(photo_id)
+        if meta is not None:
+            return meta
+        if not os.path.exists(self._path('originals', photo_id)):
+            return None
+        self._ensure_processing(photo_id)
+        # Giving up on a photo writes its error state right away
+        return self._read_meta(photo_id) or {'photoId': photo_id, 'state': 'processing'}
+
+    def file_path(self, photo_id: str, variant: str) -> Optional[str]:
+        """Path of the processed ``image`` or ``thumbnail``, or None if not ready"""
+        if not _PHOTO_ID_PATTERN.match(photo_id):
+            return None
+        path = self._path('images' if variant == 'image' else 'thumbs', photo_id, '.jpg')
+        return path if os.path.exists(path) else None
+
+    # ------------------------------------------------------------------
+    def _path(self, kind: str, photo_id: str, suffix: str = '') -> str:
+        # Two-character fan-out keeps directories small
+        return os.path.join(self.directory, kind, photo_id[:2], photo_id + suffix)
+
+    def _ensure_processing(self, photo_id: str) -> None:
+        meta_path = self._path('meta', photo_id, '.json')
+        if os.path.exists(meta_path):
+            return
+        attempt = self._claim(photo_id)
+        if attempt is None:
+            return
+        if os.path.exists(meta_path):
+            # Another worker finished it between the check and the claim
+            self._release_claim(photo_id)
+            return
+        if attempt > self.max_attempts:
+            # Each earlier attempt crashed its pool process (e.g. a decompression
+            # bomb); resubmitting would only break the pool again
+            logger.error("Giving up on photo %s after %s failed attempts", photo_id, attempt - 1)
+            self._write_meta(photo_id, {
+                'state': 'error',
+                'error': f"Could not process photo (failed {attempt - 1} times)"
+            })
+            self._release_claim(photo_id)
+            return
+
+        args = (self._path('originals', photo_id), self._path('images', photo_id, '.jpg'),
+                self._path('thumbs', photo_id, '.jpg'), meta_path,
+                self.max_dimension, self.thumbnail_size, self.quality)
+        try:
+            with self._lock:
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(process_photo, *args)
+                except BrokenProcessPool:
+                    self._executor = None
+                    executor = self._get_executor()
+                    future = executor.submit(process_photo, *args)
+        except Exception:
+            self._release_claim(photo_id, failed=True)
+            raise
+        future.add_done_callback(lambda f: self._on_done(photo_id, executor, f))
+
+    def _on_done(self, photo_id: str, executor: ProcessPoolExecutor, future: Future) -> None:
+        exc = future.exception()
+        with self._lock:
+            if isinstance(exc, BrokenProcessPool) and self._executor is executor:
+                # A pool process died (e.g. out of memory); the next poll
+                # resubmits the photo to a fresh pool
+                self._executor = None
+        self._release_claim(photo_id, failed=exc is not None)
+        if exc is not None:
+            logger.error("Processing photo %s failed: %s", photo_id, exc)
+        else:
+            logger.info("Processed photo %s (%s)", photo_id, future.result()['state'])
+
+    def _claim(self, photo_id: str) -> Optional[int]:
+        """Create the photo's claim file and return which attempt this is, or
+        None if a live claim already exists"""
+        path = self._path('meta', photo_id, '.claim')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        attempts = 0
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                attempts = self._break_stale_claim(path)
+                if attempts is None:
+                    return None
+                continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'pid': os.getpid(), 'claimed': time.time(), 'attempts': attempts + 1}, f)
+            return attempts + 1
+        return None
+
+    def _break_stale_claim(self, path: str) -> Optional[int]:
+        """Remove the claim at ``path`` if it is stale or released after a
+        failure. Returns the attempts it recorded, or None if it is live."""
+        try:
+            with open(path, encoding='utf-8') as f:
+                content = f.read()
+            age = time.time() - os.path.getmtime(path)
+        except FileNotFoundError:
+            return 0
+        attempts, released = 0, False
+        try:
+            claim = json.loads(content)
+            attempts = int(claim.get('attempts', 0))
+            released = claim['pid'] is None
+            alive = not released and _process_alive(claim['pid'])
+            age = time.time() - claim['claimed']
+        except (ValueError, KeyError, TypeError, AttributeError):
+            # Still being written, or corrupt: judged by its age alone
+            alive = True
+        if alive and age < self.claim_timeout:
+            return None
+
+        # Move the claim aside before deleting it, so that a claim another
+        # worker has just put in its place is not deleted by mistake
+        grave = f'{path}.{os.getpid()}-{threading.get_ident()}'
+        try:
+            os.rename(path, grave)
+        except FileNotFoundError:
+            return attempts
+        try:
+            with open(grave, encoding='utf-8') as f:
+                if f.read() != content:
+                    os.link(grave, path)
+                    return None
+        except FileExistsError:
+            return None
+        finally:
+            os.unlink(grave)
+        if not released:
+            logger.warning("Replacing stale processing claim %s", path)
+        return attempts
+
+    def _release_claim(self, photo_id: str, failed: bool = False) -> None:
+        """Remove this process's claim; after a failure keep it, released, so the
+        next attempt knows how many came before"""
+        path = self._path('meta', photo_id, '.claim')
+        try:
+            with open(path, encoding='utf-8') as f:
+                claim = json.load(f)
+            if claim.get('pid') != os.getpid():
+                # Taken over by another worker after timing out
+                return
+            if not failed:
+                os.unlink(path)
+                return
+            claim['pid'] = None
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(claim, f)
+            os.replace(tmp, path)
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def _read_meta(self, photo_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path('meta', photo_id, '.json'), encoding='utf-8') as f:
+                return {'photoId': photo_id, **json.load(f)}
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, photo_id: str, meta: Dict[str, Any]) -> None:
+        path = self._path('meta', photo_id, '.json')
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Called with the lock held. Each process builds its own pool; pool
+        # processes come from a forkserver rather than forking this
+        # multi-threaded worker
+        pid = os.getpid()
+        if self._pid != pid:
+            self._executor = None
+            self._pid = pid
+        if self._executor is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context(method))
+        return self._executor
+
+
+photo_store = PhotoStore(
+    directory=settings.PHOTO_STORE_DIR,
+    max_bytes=settings.PHOTO_MAX_BYTES,
+    max_workers=settings.PHOTO_PROCESS_WORKERS,
+    max_dimension=settings.PHOTO_MAX_DIMENSION,
+    thumbnail_size=settings.PHOTO_THUMBNAIL_SIZE,
+    quality=settings.PHOTO_JPEG_QUALITY,
+    claim_timeout=settings.PHOTO_CLAIM_TIMEOUT_SECONDS,
+    max_attempts=settings.PHOTO_MAX_ATTEMPTS
+)
@@ -0,0 +1,358 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from config import settings
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """An in-progress upstream call that concurrent identical requests wait on.
+
+    A streamed flight also records the chunks produced so far, so that callers
+    joining it late replay them and then follow the rest as it arrives.
+    """
+
+    def __init__(self, streaming: bool = False):
+        self.streaming = streaming
+        self.followers = 0
+        self.chunks: List[str] = []
+        self.done = False
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+
+    def append(self, chunk: str) -> None:
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, result: Optional[str], error: Optional[BaseException]) -> None:
+        with self.condition:
+            self.result, self.error, self.done = result, error, True
+            self.condition.notify_all()
+
+    def follow(self) -> Iterator[str]:
+        """Yield the flight's chunks (or, for a plain call, its result) as they arrive"""
+        index = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.done or len(self.chunks) > index)
+                new, done = self.chunks[index:], self.done
+            index += len(new)
+            yield from new
+            if done:
+                break
+        if self.error is not None:
+            raise self.error
+        if not self.streaming:
+            yield self.result
+
+
+class TemplateCache:
+    """Content-addressed cache for generated templates.
+
+    Entries are keyed on a hash of the normalized prompt, model and temperature.
+    The memory tier is an LRU bounded by ``max_entries``; every entry expires
+    after ``ttl_seconds``. When ``disk_dir`` is set, entries are also written
+    there so they survive restarts and are shared between workers.
+    Concurrent misses for the same key are coalesced into a single upstream call.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 86400,
+                 disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Strip indentation and blank lines so cosmetic changes don't miss the cache"""
+        return '\n'.join(line.strip() for line in prompt.splitlines() if line.strip())
+
+    @classmethod
+    def make_key(cls, prompt: str, model: str, temperature: float) -> str:
+        """Return the content address for a prompt/model/temperature triple"""
+        payload = json.dumps(
+            [cls.normalize_prompt(prompt), model, temperature],
+            ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for ``key`` or None, counting hits and misses."""
+        value = self._lookup(key)
+        if value is None:
+            with self._lock:
+                self._misses += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._store_memory(key, value, time.time())
+        self._store_disk(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        """Return the cached value for ``key``, calling ``compute`` at most once
+        across all concurrent callers on a miss.
+
+        Errors raised by ``compute`` are propagated to every waiting caller and
+        are never cached.
+        """
+        value, flight, leader = self._join_or_lead(key, streaming=False)
+        if value is not None:
+            return value
+        if not leader:
+            try:
+                return ''.join(flight.follow())
+            finally:
+                self._leave(flight)
+
+        result = error = None
+        try:
+            result = compute()
+            self.set(key, result)
+            return result
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            self._land(key, flight)
+            flight.finish(result, error)
+
+    def stream(self, key: str, produce: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """Yield the value for ``key`` in chunks: the cached value as one chunk, or
+        the chunks of ``produce()``, shared by all concurrent callers on a miss.
+
+        Callers joining an in-flight stream first get the chunks produced so
+        far, then follow the rest. If the leading caller stops early while
+        others are still following, the stream is finished for them on a
+        background thread; otherwise ``produce()`` is closed. Complete
+        results are cached.
+        """
+        value, flight, leader = self._join_or_lead(key, streaming=True)
+        if value is not None:
+            yield value
+            return
+        if not leader:
+            try:
+                yield from flight.follow()
+            finally:
+                # A follower that disconnects no longer keeps the stream alive
+                self._leave(flight)
+            return
+
+        chunks = produce()
+        parts: List[str] = []
+        error = None
+        handed_off = False
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                flight.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            with self._lock:
+                handed_off = flight.followers > 0
+                if not handed_off:
+                    self._land(key, flight, locked=True)
+            if handed_off:
+                threading.Thread(target=self._drain, args=(key, flight, chunks, parts),
+                                 name='template-stream', daemon=True).start()
+            else:
+                error = RuntimeError("Template stream cancelled")
+            raise
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            if not handed_off:
+                self._finish_stream(key, flight, chunks, parts, error)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/coalesced counters and the current memory size"""
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'hit_ratio': (self._hits + self._coalesced) / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'in_flight': len(self._flights),
+                'disk_enabled': bool(self.disk_dir),
+            }
+
+    def clear(self) -> None:
+        """Drop all memory entries and reset the counters (disk entries are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._disk_hits = self._misses = self._coalesced = 0
+
+    # ------------------------------------------------------------------
+    # Internal helpers (callers must hold self._lock where noted)
+    # ------------------------------------------------------------------
+    def _join_or_lead(self, key: str, streaming: bool) -> Tuple[Optional[str], Optional[_Flight], bool]:
+        """Return ``(cached value, None, False)``, ``(None, in-flight call, False)``
+        or ``(None, new flight, True)`` when the caller must compute the value"""
+        value = self._lookup(key)
+        if value is not None:
+            return value, None, False
+
+        with self._lock:
+            # Another caller may have stored it while we read the disk
+            value = self._get_memory(key, time.time())
+            if value is not None:
+                self._hits += 1
+                return value, None, False
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._coalesced += 1
+                flight.followers += 1
+                return None, flight, False
+            self._misses += 1
+            flight = self._flights[key] = _Flight(streaming)
+            return None, flight, True
+
+    def _leave(self, flight: _Flight) -> None:
+        with self._lock:
+            flight.followers -= 1
+
+    def _land(self, key: str, flight: _Flight, locked: bool = False) -> None:
+        """Unregister ``flight`` (but not a newer flight for the same key)"""
+        if not locked:
+            with self._lock:
+                return self._land(key, flight, locked=True)
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _drain(self, key: str, flight: _Flight, chunks: Iterator[str], parts: List[str]) -> None:
+        """Finish a stream whose leader went away, for the callers following it"""
+        error = None
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                flight.append(chunk)
+        except Exception as exc:
+            error = exc
+        self._finish_stream(key, flight, chunks, parts, error)
+
+    def _finish_stream(self, key: str, flight: _Flight, chunks: Iterator[str],
+                       parts: List[str], error: Optional[BaseException]) -> None:
+        chunks.close()
+        result = None
+        if error is None:
+            result = ''.join(parts)
+            self.set(key, result)
+        self._land(key, flight)
+        flight.finish(result, error)
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """Memory, then disk lookup counting hits; the disk is read without the lock"""
+        now = time.time()
+        with self._lock:
+            value = self._get_memory(key, now)
+            if value is not None:
+                self._hits += 1
+                return value
+
+        disk_entry = self._load_disk(key, now)
+        if disk_entry is None:
+            return None
+        value, created = disk_entry
+        with self._lock:
+            self._store_memory(key, value, created)
+            self._hits += 1
+            self._disk_hits += 1
+        return value
+
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        # Lock held
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, created = entry
+        if now - created < self.ttl_seconds:
+            self._entries.move_to_end(key)
+            return value
+        del self._entries[key]
+        return None
+
+    def _store_memory(self, key: str, value: str, created: float) -> None:
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f'{key}.json')
+
+    def _load_disk(self, key: str, now: float) -> Optional[tuple]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                entry = json.load(fh)
+            value, created = entry['value'], float(entry['created'])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            logger.warning("Discarding unreadable cache entry %s: %s", path, exc)
+            return None
+
+        if now - created >= self.ttl_seconds:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return value, created
+
+    def _store_disk(self, key: str, value: str) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+                json.dump({'value': value, 'created': time.time()}, fh, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            tmp_path = None
+        except (OSError, TypeError, ValueError) as exc:
+            # The disk tier is best-effort; the memory tier already holds the value
+            logger.warning("Failed to persist cache entry %s: %s", key, exc)
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+
+# Shared cache instance used by OpenAIService
+template_cache = TemplateCache(
+    max_entries=settings.TEMPLATE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.TEMPLATE_CACHE_TTL_SECONDS,
+    disk_dir=settings.TEMPLATE_CACHE_DIR or None,
+)
@@ -0,0 +1,102 @@
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple, Union
+import html
+import re
+
+# Same patterns as replaceFieldValues in static/js/renderers/docBuilderRenderer.js
+EACH_PATTERN = re.compile(r'\{\{#each ([^}]+)\}\}([\s\S]*?)\{\{/each\}\}')
+THIS_FIELD_PATTERN = re.compile(r'\{\{this\.([^}]+)\}\}')
+
+MISSING_VALUE = 'No disponible'
+MISSING_HIGHLIGHT = f'<span class="highlight">{MISSING_VALUE}</span>'
+
+# Compiled form: a tuple of segments. Literal text is stored pre-escaped.
+#   ('text', escaped_text)
+#   ('each', path_parts, body_format, field_names) where body_format is the
+#       escaped block body as a str.format pattern with one ``{}`` per field
+Segment = Tuple[Any, ...]
+
+
+class TemplateRendererError(Exception):
+    """Custom exception for template rendering errors"""
+    pass
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str) -> Tuple[Segment, ...]:
+    """Parse a template once into segments; results are cached per template"""
+    segments: List[Segment] = []
+    position = 0
+    for match in EACH_PATTERN.finditer(template):
+        if match.start() > position:
+            segments.append(('text', html.escape(template[position:match.start()], quote=False)))
+        body_format, field_names = _compile_body(match.group(2))
+        segments.append(('each', tuple(match.group(1).split('.')), body_format, field_names))
+        position = match.end()
+    if position < len(template):
+        segments.append(('text', html.escape(template[position:], quote=False)))
+    return tuple(segments)
+
+
+def _compile_body(body: str) -> Tuple[str, Tuple[str, ...]]:
+    parts: List[str] = []
+    field_names: List[str] = []
+    position = 0
+    for match in THIS_FIELD_PATTERN.finditer(body):
+        parts.append(_format_literal(body[position:match.start()]))
+        parts.append('{}')
+        field_names.append(match.group(1))
+        position = match.end()
+    parts.append(_format_literal(body[position:]))
+    return ''.join(parts), tuple(field_names)
+
+
+def _format_literal(text: str) -> str:
+    return html.escape(text, quote=False).replace('{', '{{').replace('}', '}}')
+
+
+def _resolve(fields: Dict[str, Any], path: Tuple[str, ...]) -> List[Any]:
+    value: Union[Dict[str, Any], Any] = fields
+    for part in path:
+        value = value.get(part) if isinstance(value, dict) else None
+    return value if isinstance(value, list) else []
+
+
+def _highlight(value: Any) -> str:
+    if not value:
+        return MISSING_HIGHLIGHT
+    text = str(value)
+    # Most field values are plain text; skip html.escape unless there is something to escape
+    if '&' in text or '<' in text or '>' in text or '"' in text or "'" in text:
+        text = html.escape(text)
+    return f'<span class="highlight">{text}</span>'
+
+
+def render_template(template: str, fields: Dict[str, Any]) -> str:
+    """Render a ``{{#each}}`` / ``{{this.x}}`` template to HTML.
+
+    Mirrors replaceFieldValues in the frontend: each item of an ``{{#each}}``
+    block renders the block body, items are joined with newlines, and every
+    ``{{this.field}}`` becomes a highlighted span holding the item's value or
+    ``No disponible``. Unlike the frontend, literal text and values are
+    HTML-escaped.
+    """
+    if not isinstance(template, str) or not isinstance(fields, dict):
+        raise TemplateRendererError("template must be a string and fields an object")
+
+    out: List[str] = []
+    for segment in compile_template(template):
+        if segment[0] == 'text':
+            out.append(segment[1])
+            continue
+
+        _, path, body_format, field_names = segment
+        rendered_items = []
+        for item in _resolve(fields, path):
+            if not isinstance(item, dict):
+                item = {}
+            rendered_items.append(body_format.format(*[
+                _highlight(item.get(name)) for name in field_names
+            ]))
+        out.append('\n'.join(rendered_items))
+    return ''.join(out)
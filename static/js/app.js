@@ -64,6 +64,12 @@ class NodeGraphEditor extends EventEmitter {
         this.offsetY = 0;
         this.nextNodeId = 1;
         this.selectedConnection = null; 
+
+        // Delta-save tracking: structural ops in order, plus nodes edited in place
+        this.graphId = 'default';
+        this.graphVersion = 0;
+        this.pendingOps = [];
+        this.dirtyNodes = new Map(); // node id -> Set of 'position' | 'content'
         
         this.init();
     }
@@ -154,6 +160,7 @@ class NodeGraphEditor extends EventEmitter {
 
         
         this.nodes.push(node);
+        this.pendingOps.push({ op: 'addNode', node });
         this.renderNode(node);
         return node;
     }
@@ -329,6 +336,9 @@ class NodeGraphEditor extends EventEmitter {
                 node.classList.remove('dragging');
             });
             
+            if (this.selectedNode) {
+                this.markNodeDirty(this.selectedNode, 'position');
+            }
             this.dragging = false;
             this.selectedNode = null;
         } else if (this.connecting && this.connectionStart) {
@@ -477,11 +487,13 @@ class NodeGraphEditor extends EventEmitter {
             document.querySelectorAll(`[data-connector-id="${sourceId}"], [data-connector-id="${targetId}"]`)
                 .forEach(el => el.classList.add('connected'));
                 
-            this.connections.push({
+            const connection = {
                 id: `${sourceId}-${targetId}`,
                 source: sourceId,
                 target: targetId
-            });
+            };
+            this.connections.push(connection);
+            this.pendingOps.push({ op: 'addConnection', connection });
             
             this.updateConnections();
            
@@ -493,6 +505,7 @@ class NodeGraphEditor extends EventEmitter {
             );
             if (targetNode) {
                 updateDocBuilderState(targetNode, this.connections);
+                this.markNodeDirty(targetNode, 'content');
             }
         }
    }
@@ -548,7 +561,7 @@ class NodeGraphEditor extends EventEmitter {
 
     async loadNodes() {
         try {
-            const response = await fetch('/api/nodes');
+            const response = await fetch(`/api/nodes/${this.graphId}`);
             const data = await response.json();
             
             // Clear existing nodes
@@ -557,6 +570,10 @@ class NodeGraphEditor extends EventEmitter {
             this.nodes = (data.nodes || []).map(reviveNode);
             this.connections = data.connections || [];
             
+            this.graphVersion = data.version || 0;
+            this.pendingOps = [];
+            this.dirtyNodes.clear();
+            
             // Fix the syntax error and update nextNodeId
             if (this.nodes.length > 0) {
                 this.nextNodeId = Math.max(...this.nodes.map(n => n.id)) + 1;
@@ -575,18 +592,66 @@ class NodeGraphEditor extends EventEmitter {
         }
     }
 
+    // Record that a node changed in place so the next save sends it
+    markNodeDirty(node, kind) {
+        if (!this.dirtyNodes.has(node.id)) {
+            this.dirtyNodes.set(node.id, new Set());
+        }
+        this.dirtyNodes.get(node.id).add(kind);
+    }
+
+    // Build the patch ops for everything changed since the last save
+    buildPatchOps() {
+        const ops = [...this.pendingOps];
+        const added = new Set(this.pendingOps
+            .filter(op => op.op === 'addNode')
+            .map(op => op.node.id));
+
+        this.dirtyNodes.forEach((kinds, id) => {
+            // Newly added nodes are sent in full by their addNode op
+            if (added.has(id)) return;
+            const node = this.nodes.find(n => n.id === id);
+            if (!node) return;
+
+            if (kinds.has('content')) {
+                ops.push({
+                    op: 'updateNode',
+                    id,
+                    changes: { x: node.x, y: node.y, state: node.state, title: node.title, data: node.data }
+                });
+            } else {
+                ops.push({ op: 'moveNode', id, x: node.x, y: node.y });
+            }
+        });
+        return ops;
+    }
+
     async saveNodes() {
         try {
-            await fetch('/api/nodes', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    nodes: this.nodes,
-                    connections: this.connections
-                }),
-            });
+            // Patches need a saved base version; the first save sends everything
+            const response = this.graphVersion
+                ? await this.patchNodes()
+                : await this.saveAllNodes();
+            const data = await response.json();
+
+            if (response.status === 409) {
+                const overwrite = confirm(
+                    'The graph was changed elsewhere since you loaded it. ' +
+                    'Overwrite it with your version? (Cancel reloads the saved graph)'
+                );
+                if (overwrite) {
+                    this.graphVersion = 0;
+                    return this.saveNodes();
+                }
+                return this.loadNodes();
+            }
+            if (!response.ok) {
+                throw new Error(data.message);
+            }
+
+            this.graphVersion = data.version;
+            this.pendingOps = [];
+            this.dirtyNodes.clear();
             alert('Nodes saved successfully!');
         } catch (error) {
             console.error('Error saving nodes:', error);
@@ -594,6 +659,32 @@ class NodeGraphEditor extends EventEmitter {
         }
     }
 
+    saveAllNodes() {
+        return fetch(`/api/nodes/${this.graphId}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                nodes: this.nodes,
+                connections: this.connections
+            }),
+        });
+    }
+
+    patchNodes() {
+        return fetch(`/api/nodes/${this.graphId}`, {
+            method: 'PATCH',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                baseVersion: this.graphVersion,
+                ops: this.buildPatchOps()
+            }),
+        });
+    }
+
 
     async updateOutputTextt(targetId) {
         return updateOutputText(targetId, this);
@@ -626,6 +717,10 @@ class NodeGraphEditor extends EventEmitter {
         if (nodeIndex > -1) {
             this.nodes.splice(nodeIndex, 1);
         }
+
+        // The server drops the node's connections along with it
+        this.pendingOps.push({ op: 'deleteNode', id: nodeId });
+        this.dirtyNodes.delete(nodeId);
         
         // Remove node element from DOM
         const nodeEl = document.querySelector(`[data-node-id="${nodeId}"]`);
@@ -687,7 +782,8 @@ class NodeGraphEditor extends EventEmitter {
         );
         
         if (index > -1) {
-            this.connections.splice(index, 1);
+            const [removed] = this.connections.splice(index, 1);
+            this.pendingOps.push({ op: 'removeConnection', id: removed.id });
             
             document.querySelectorAll(
                 `[data-connector-id="${connection.source}"], [data-connector-id="${connection.target}"]`
@@ -705,6 +801,7 @@ class NodeGraphEditor extends EventEmitter {
             );
             if (targetNode) {
                 updateDocBuilderState(targetNode, this.connections);
+                this.markNodeDirty(targetNode, 'content');
             }
         }
     }
@@ -712,6 +809,8 @@ class NodeGraphEditor extends EventEmitter {
   
 
     updateNodeDisplay(node) {
+        this.markNodeDirty(node, 'content');
+
         const nodeEl = document.querySelector(`[data-node-id="${node.id}"]`);
         if (!nodeEl) return;
         
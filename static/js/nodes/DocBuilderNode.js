@@ -60,37 +60,24 @@ export class DocBuilderNode extends BaseNode {
             vendedor: [],
             comprador: []
         };
-        
-        // Get all Vendedor connections
-        const vendedorConnections = connections.filter(conn => 
-            conn.target === this.inputs.find(i => i.name === 'Vendedor')?.id
-        );
-        
-        // Get all Comprador connections
-        const compradorConnections = connections.filter(conn => 
-            conn.target === this.inputs.find(i => i.name === 'Comprador')?.id
-        );
-        
-        // Process Vendedor connections
-        vendedorConnections.forEach(conn => {
-            const vendedorNode = nodes.find(node => 
-                node.outputs.some(output => output.id === conn.source)
-            );
-            if (vendedorNode?.data) {
-                fields.vendedor.push(vendedorNode.data);
-            }
+    
+        // Index output ports by owning node once, instead of scanning nodes per connection
+        const outputOwner = new Map();
+        nodes.forEach(node => {
+            node.outputs.forEach(output => outputOwner.set(output.id, node));
         });
+        const inputKeys = new Map(this.inputs.map(input => [input.id, input.name.toLowerCase()]));
+    
+        connections.forEach(conn => {
+            const key = inputKeys.get(conn.target);
+            if (!fields[key]) return;
         
-        // Process Comprador connections
-        compradorConnections.forEach(conn => {
-            const compradorNode = nodes.find(node => 
-                node.outputs.some(output => output.id === conn.source)
-            );
-            if (compradorNode?.data) {
-                fields.comprador.push(compradorNode.data);
+            const sourceNode = outputOwner.get(conn.source);
+            if (sourceNode?.data) {
+                fields[key].push(sourceNode.data);
             }
         });
-        
+    
         return fields;
     }
     
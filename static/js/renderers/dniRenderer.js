@@ -7,7 +7,7 @@ export function renderDNINodeUI(node, editor, container) {
     container.appendChild(collapsible);
 
     // Photo buttons
-    const photoButtons = createPhotoButtons(node);
+    const photoButtons = createPhotoButtons(node, editor);
     container.appendChild(photoButtons);
 
     // Action buttons
@@ -73,13 +73,13 @@ function createJSONEditor(node, editor) {
         { key: 'address', label: 'Address' },
     ];
 
-    fields.forEach((f) => createField(f, node, jsonEditor));
+    fields.forEach((f) => createField(f, node, editor, jsonEditor));
 
     return jsonEditor;
 }
 
 // Helper to create individual form fields
-function createField(field, node, container) {
+function createField(field, node, editor, container) {
     const fieldContainer = document.createElement('div');
     fieldContainer.className = 'json-field';
 
@@ -95,6 +95,7 @@ function createField(field, node, container) {
     input.addEventListener('input', (e) => {
         node.data = node.data || {};
         node.data[field.key] = e.target.value;
+        editor.markNodeDirty(node, 'content');
         updateNodeTitle(node);
         updateNodeSubtitle(node);
     });
@@ -105,32 +106,104 @@ function createField(field, node, container) {
 }
 
 // Existing helper builders
-function createPhotoButtons(node) {
+function createPhotoButtons(node, editor) {
     const container = document.createElement('div');
     container.className = 'photo-capture-buttons';
 
-    // Front photo button
-    const frontPhotoBtn = document.createElement('button');
-    frontPhotoBtn.className = 'photo-capture-btn';
-    frontPhotoBtn.innerHTML = `<span class="icon">📸</span> Tomar foto frente DNI`;
-    frontPhotoBtn.onclick = (e) => {
-        e.stopPropagation();
-        console.log('Capture front photo for node:', node.id);
-    };
+    container.appendChild(createPhotoButton(node, editor, 'front', 'Tomar foto frente DNI'));
+    container.appendChild(createPhotoButton(node, editor, 'back', 'Tomar foto dorso DNI'));
+
+    return container;
+}
+
+// One photo slot: the node keeps only the photo id returned by the server
+// (node.data.photos[side]); the image itself stays on the server
+function createPhotoButton(node, editor, side, label) {
+    const wrapper = document.createElement('div');
+
+    const button = document.createElement('button');
+    button.className = 'photo-capture-btn';
+    button.innerHTML = `<span class="icon">📸</span> ${label}`;
+
+    const input = document.createElement('input');
+    input.type = 'file';
+    input.accept = 'image/jpeg,image/png,image/webp';
+    input.capture = 'environment';
+    input.style.display = 'none';
+
+    const thumbnail = document.createElement('img');
+    thumbnail.className = 'photo-thumbnail';
+    thumbnail.alt = label;
 
-    // Back photo button
-    const backPhotoBtn = document.createElement('button');
-    backPhotoBtn.className = 'photo-capture-btn';
-    backPhotoBtn.innerHTML = `<span class="icon">📸</span> Tomar foto dorso DNI`;
-    backPhotoBtn.onclick = (e) => {
+    button.onclick = (e) => {
         e.stopPropagation();
-        console.log('Capture back photo for node:', node.id);
+        input.click();
     };
 
-    container.appendChild(frontPhotoBtn);
-    container.appendChild(backPhotoBtn);
+    input.addEventListener('change', async () => {
+        const file = input.files[0];
+        input.value = '';
+        if (!file) return;
+
+        button.classList.remove('success', 'error');
+        try {
+            const photoId = await uploadPhoto(file);
+            node.data = node.data || {};
+            node.data.photos = { ...node.data.photos, [side]: photoId };
+            editor.markNodeDirty(node, 'content');
+            await showPhoto(photoId, button, thumbnail);
+        } catch (error) {
+            console.error('Error uploading photo:', error);
+            button.classList.add('error');
+        }
+    });
 
-    return container;
+    const savedId = node.data?.photos?.[side];
+    if (savedId) {
+        showPhoto(savedId, button, thumbnail).catch((error) => {
+            console.error('Error loading photo:', error);
+            button.classList.add('error');
+        });
+    }
+
+    wrapper.appendChild(button);
+    wrapper.appendChild(input);
+    wrapper.appendChild(thumbnail);
+    return wrapper;
+}
+
+// Sends the file as the raw request body so the server can stream it to disk
+async function uploadPhoto(file) {
+    const response = await fetch('/api/photos', {
+        method: 'POST',
+        headers: {
+            'Content-Type': file.type || 'application/octet-stream',
+        },
+        body: file,
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.message);
+    }
+    return data.photoId;
+}
+
+// Polls the photo until processing finishes, then shows its thumbnail
+async function showPhoto(photoId, button, thumbnail) {
+    let delay = 500;
+    for (;;) {
+        const response = await fetch(`/api/photos/${photoId}`);
+        const data = await response.json();
+        if (!response.ok || data.state === 'error') {
+            throw new Error(data.error || data.message);
+        }
+        if (data.state === 'ready') break;
+        await new Promise((resolve) => setTimeout(resolve, delay));
+        delay = Math.min(delay * 2, 4000);
+    }
+    thumbnail.src = `/api/photos/${photoId}/thumbnail`;
+    thumbnail.classList.add('loaded');
+    button.classList.add('success');
 }
 
 function createActionButtons(node, editor) {
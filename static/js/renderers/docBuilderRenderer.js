@@ -58,8 +58,6 @@ export function replaceFieldValues(template, fields) {
 // Get template text from API or fallback
 export async function getTemplateText(fields) {
     try {
-        console.log('Sending fields to API:', fields);  // Debug log
-        
         const response = await fetch('/api/generate-template', {
             method: 'POST',
             headers: {
@@ -69,7 +67,6 @@ export async function getTemplateText(fields) {
         });
         
         const data = await response.json();
-        console.log('API response:', data);  // Debug log
         
         if (data.status === 'success') {
             return data.template;
@@ -83,6 +80,76 @@ export async function getTemplateText(fields) {
     }
 }
 
+// Stream template text from the SSE endpoint, calling onChunk with the text so far.
+// Falls back to the blocking endpoint if streaming is unavailable.
+export async function streamTemplateText(fields, onChunk) {
+    try {
+        const response = await fetch('/api/generate-template/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+            },
+            body: JSON.stringify({ fields })
+        });
+
+        if (!response.ok || !response.body) {
+            throw new Error(`Streaming not available (${response.status})`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE messages are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = parseSSEMessage(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+
+                if (message.event === 'error') {
+                    throw new Error(message.data.message);
+                }
+                if (message.event === 'done') {
+                    return text;
+                }
+                if (message.data?.delta) {
+                    text += message.data.delta;
+                    onChunk(text);
+                }
+            }
+        }
+        return text;
+    } catch (error) {
+        console.error('Error streaming template, falling back:', error);
+        const text = await getTemplateText(fields);
+        onChunk(text);
+        return text;
+    }
+}
+
+function parseSSEMessage(raw) {
+    const message = { event: 'message', data: null };
+    const dataLines = [];
+    raw.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            message.event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    if (dataLines.length) {
+        message.data = JSON.parse(dataLines.join('\n'));
+    }
+    return message;
+}
+
 // Get input fields for a DocBuilder node
 export function getInputFields(nodes, connections, outputNode) {
     const fields = {
@@ -90,33 +157,20 @@ export function getInputFields(nodes, connections, outputNode) {
         comprador: []
     };
     
-    // Get all Vendedor connections
-    const vendedorConnections = connections.filter(conn => 
-        conn.target === outputNode.inputs.find(i => i.name === 'Vendedor')?.id
-    );
-    
-    // Get all Comprador connections
-    const compradorConnections = connections.filter(conn => 
-        conn.target === outputNode.inputs.find(i => i.name === 'Comprador')?.id
-    );
-    
-    // Process Vendedor connections
-    vendedorConnections.forEach(conn => {
-        const vendedorNode = nodes.find(node => 
-            node.outputs.some(output => output.id === conn.source)
-        );
-        if (vendedorNode?.data) {
-            fields.vendedor.push(vendedorNode.data);
-        }
+    // Index output ports by owning node once, instead of scanning nodes per connection
+    const outputOwner = new Map();
+    nodes.forEach(node => {
+        node.outputs.forEach(output => outputOwner.set(output.id, node));
     });
+    const inputKeys = new Map(outputNode.inputs.map(input => [input.id, input.name.toLowerCase()]));
     
-    // Process Comprador connections
-    compradorConnections.forEach(conn => {
-        const compradorNode = nodes.find(node => 
-            node.outputs.some(output => output.id === conn.source)
-        );
-        if (compradorNode?.data) {
-            fields.comprador.push(compradorNode.data);
+    connections.forEach(conn => {
+        const key = inputKeys.get(conn.target);
+        if (!fields[key]) return;
+        
+        const sourceNode = outputOwner.get(conn.source);
+        if (sourceNode?.data) {
+            fields[key].push(sourceNode.data);
         }
     });
     
@@ -160,19 +214,31 @@ export async function updateOutputText(targetId, editor) {
                 // Get the fields
                 const fields = getInputFields(editor.nodes, editor.connections, outputNode);
                 
-                // Get the LLM-generated template and replace values
-                const template = await getTemplateText(fields);
-                const finalText = replaceFieldValues(template, fields);
-                
                 // Create the output div
                 const textDiv = document.createElement('div');
                 textDiv.className = 'node-textarea';
                 textDiv.contentEditable = true;
                 textDiv.style.whiteSpace = 'pre-wrap';
-                textDiv.innerHTML = finalText;
-                
+
                 // Replace the old textarea
                 textarea.parentNode.replaceChild(textDiv, textarea);
+
+                // Render the LLM-generated template progressively, at most once per frame
+                let pending = null;
+                let finished = false;
+                const template = await streamTemplateText(fields, (partial) => {
+                    if (pending === null) {
+                        requestAnimationFrame(() => {
+                            if (!finished) {
+                                textDiv.innerHTML = replaceFieldValues(pending, fields);
+                            }
+                            pending = null;
+                        });
+                    }
+                    pending = partial;
+                });
+                finished = true;
+                textDiv.innerHTML = replaceFieldValues(template, fields);
                 
             } catch (error) {
                 console.error('Error updating output text:', error);
@@ -0,0 +1,5 @@
+import os
+
+# config.Settings requires an API key; tests never reach the real API
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ.setdefault('METRICS_DIR', '')
@@ -0,0 +1,24 @@
+"""Saving and patching graph versions."""
+import pytest
+
+from services.graph_store import GraphStore, InvalidPatchError, VersionConflictError
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = GraphStore(str(tmp_path / 'graphs.db'))
+    yield store
+    store.close()
+
+
+def test_patching_an_unsaved_graph_is_invalid(store):
+    with pytest.raises(InvalidPatchError, match='saved in full'):
+        store.apply_patch('new', 0, [{'op': 'deleteNode', 'id': 1}])
+
+
+def test_patching_a_stale_version_conflicts(store):
+    store.save('g', {'nodes': [{'id': 1}], 'connections': []})
+    store.apply_patch('g', 1, [{'op': 'addNode', 'node': {'id': 2}}])
+    with pytest.raises(VersionConflictError) as excinfo:
+        store.apply_patch('g', 1, [{'op': 'deleteNode', 'id': 2}])
+    assert excinfo.value.latest_version == 2
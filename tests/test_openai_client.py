@@ -0,0 +1,92 @@
+"""Upstream limiter: queue timeouts, retries and the shared retry budget,
+exercised against the local stub chat-completions server."""
+import threading
+
+import pytest
+from openai import InternalServerError, OpenAI, RateLimitError
+
+from benchmarks.stub_openai import start_stub_server
+from services.openai_client import UpstreamBusyError, UpstreamLimiter
+
+
+@pytest.fixture
+def stub():
+    server, base_url = start_stub_server()
+    client = OpenAI(api_key='stub', base_url=base_url, max_retries=0)
+    yield server, client
+    server.shutdown()
+    server.server_close()
+
+
+def complete(client):
+    return client.chat.completions.create(
+        model='stub', messages=[{'role': 'user', 'content': 'hola'}])
+
+
+def limiter(**kwargs):
+    options = dict(max_concurrency=4, queue_timeout=1.0, base_delay=0.001, max_delay=0.001)
+    options.update(kwargs)
+    return UpstreamLimiter(**options)
+
+
+def test_queue_timeout_raises_busy():
+    upstream = limiter(max_concurrency=1, queue_timeout=0.05)
+    holding, release = threading.Event(), threading.Event()
+
+    def hold():
+        with upstream.slot():
+            holding.set()
+            release.wait(2)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    holding.wait(2)
+    try:
+        with pytest.raises(UpstreamBusyError):
+            upstream.call(lambda: 'unused')
+    finally:
+        release.set()
+        thread.join()
+    assert upstream.call(lambda: 'ok') == 'ok'
+
+
+def test_rate_limit_timeout_raises_busy():
+    upstream = limiter(queue_timeout=0.05, rate=0.01, burst=1)
+    assert upstream.call(lambda: 'ok') == 'ok'
+    with pytest.raises(UpstreamBusyError):
+        upstream.call(lambda: 'unused')
+
+
+def test_successful_call_against_stub(stub):
+    server, client = stub
+    response = limiter().call(complete, client)
+    assert response.choices[0].message.content
+    assert server.request_count == 1
+
+
+def test_retries_transient_errors_until_max_retries(stub):
+    server, client = stub
+    server.error_rate = 1.0
+    with pytest.raises(InternalServerError):
+        limiter(max_retries=3).call(complete, client)
+    assert server.request_count == 4
+
+
+def test_rate_limited_calls_recover(stub):
+    server, client = stub
+    server.rate_limit_rate = 0.5
+    upstream = limiter(max_retries=20)
+    for _ in range(5):
+        assert upstream.call(complete, client).choices[0].message.content
+    assert server.request_count == 5 + server.error_count
+
+
+def test_retry_budget_is_shared_between_calls(stub):
+    server, client = stub
+    server.rate_limit_rate = 1.0
+    upstream = limiter(max_retries=3, retry_rate=0.001, retry_burst=2)
+    for _ in range(5):
+        with pytest.raises(RateLimitError):
+            upstream.call(complete, client)
+    # Five first attempts plus the two retries the budget allowed
+    assert server.request_count == 7
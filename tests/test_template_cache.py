@@ -0,0 +1,133 @@
+"""Single-flight, expiry and stream hand-off of the template cache."""
+import threading
+import time
+import types
+
+import pytest
+
+from services import template_cache as template_cache_module
+from services.template_cache import TemplateCache
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_concurrent_callers_share_one_compute():
+    cache = TemplateCache()
+    calls = []
+    barrier = threading.Barrier(16)
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'template'
+
+    def call():
+        barrier.wait()
+        results.append(cache.get_or_compute('k', compute))
+
+    threads = [threading.Thread(target=call) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['template'] * 16
+    assert cache.stats()['in_flight'] == 0
+
+
+@pytest.mark.parametrize('use_disk', [False, True])
+def test_entries_expire_after_ttl(tmp_path, monkeypatch, use_disk):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(template_cache_module, 'time', types.SimpleNamespace(time=lambda: clock.now))
+    cache = TemplateCache(ttl_seconds=60, disk_dir=str(tmp_path) if use_disk else None)
+    cache.set('k', 'old')
+
+    clock.now += 59
+    assert cache.get('k') == 'old'
+    if use_disk:
+        cache.clear()
+        assert cache.get('k') == 'old'
+
+    clock.now += 2
+    assert cache.get('k') is None
+    assert cache.get_or_compute('k', lambda: 'new') == 'new'
+
+
+def test_follower_gets_the_leaders_exception():
+    cache = TemplateCache()
+    release = threading.Event()
+    errors = []
+
+    def compute():
+        release.wait(2)
+        raise ValueError("upstream failed")
+
+    def lead():
+        with pytest.raises(ValueError):
+            cache.get_or_compute('k', compute)
+
+    def follow():
+        try:
+            cache.get_or_compute('k', lambda: 'unused')
+        except ValueError as exc:
+            errors.append(exc)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    wait_until(lambda: cache.stats()['in_flight'] == 1)
+    follower = threading.Thread(target=follow)
+    follower.start()
+    wait_until(lambda: cache.stats()['coalesced'] == 1)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert [str(e) for e in errors] == ["upstream failed"]
+    # Errors are not cached: the next call computes again
+    assert cache.get_or_compute('k', lambda: 'ok') == 'ok'
+
+
+def counting_stream(closed, count=50):
+    try:
+        for i in range(count):
+            yield f'{i} '
+    finally:
+        closed.set()
+
+
+def test_stream_is_closed_when_leader_leaves_after_followers():
+    cache = TemplateCache()
+    closed = threading.Event()
+    leader = cache.stream('k', lambda: counting_stream(closed))
+    next(leader)
+    follower = cache.stream('k', lambda: counting_stream(closed))
+    next(follower)
+
+    follower.close()
+    leader.close()
+
+    assert closed.is_set()
+    assert cache.stats()['in_flight'] == 0
+    assert cache.get('k') is None
+
+
+def test_stream_is_finished_for_a_remaining_follower():
+    cache = TemplateCache()
+    closed = threading.Event()
+    leader = cache.stream('k', lambda: counting_stream(closed))
+    next(leader)
+    follower = cache.stream('k', lambda: counting_stream(closed))
+    first = next(follower)
+
+    leader.close()
+
+    expected = ''.join(f'{i} ' for i in range(50))
+    assert first + ''.join(follower) == expected
+    assert cache.get('k') == expected